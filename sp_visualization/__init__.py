@@ -0,0 +1,11 @@
+# Justin Smethers
+# Purdue Fort Wayne Physics
+# Advised by Dr. Mark Masters
+
+'''
+Visualization and recording software of the Coincident Photon Counting Unit in Dr. Masters' lab.
+
+Importing the package, or any of its parsing, recording and analysis modules, is cheap: it doesn't open a serial port
+and doesn't load matplotlib or pyserial. Those are only imported by the code that uses them. The interactive script
+is sp_visualization.cli.main, also run by python -m sp_visualization.
+'''
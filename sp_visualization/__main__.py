@@ -0,0 +1,10 @@
+# Justin Smethers
+# Purdue Fort Wayne Physics
+# Advised by Dr. Mark Masters
+
+from .cli import main
+
+
+# The display process is spawned and imports the main module again, which mustn't start a second session
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,149 @@
+# Justin Smethers
+# Purdue Fort Wayne Physics
+# Advised by Dr. Mark Masters
+
+import re
+
+import numpy as np
+
+
+'''
+Accidental coincidence ("Noise") calculation.
+
+Uncorrelated photons on N channels with singles rates R_1 ... R_N still land inside the same coincidence window tau
+by chance at a rate of
+
+    R_acc = N * tau^(N-1) * R_1 * R_2 * ... * R_N
+
+which is 2 * tau * R_i * R_j for a pair. The PSoC reports counts per gate, so with C_i = R_i * T the accidental
+counts per gate are N * tau^(N-1) * C_1 * ... * C_N / T^(N-1).
+
+AccidentalsEngine works out which of the selected coincident channels have all of their individual channels selected
+too, and computes the accidentals of every one of them at once with NumPy, for a batch of samples or a whole run.
+'''
+
+DEFAULT_WINDOW = 1e-9     # coincidence window in seconds
+DEFAULT_GATE_TIME = 1.0   # seconds of counting per sample
+
+_UNITS = {'ps': 1e-12, 'ns': 1e-9, 'us': 1e-6, 'µs': 1e-6, 'ms': 1e-3, 's': 1.0}
+_WINDOW_PATTERN = re.compile(r'(\d+(?:\.\d+)?)\s*(ps|ns|us|µs|ms|s)\b', re.IGNORECASE)
+
+
+#
+# channel_letters
+# @params: name - channel name, eg 'Channel AB'
+# @returns: letters of the detectors the channel counts, eg 'AB'
+def channel_letters(name):
+    return name.split()[-1]
+
+
+#
+# noise_name
+# @params: name - coincident channel name, eg 'Channel AB'
+# @returns: name of its accidentals channel, eg 'Noise AB'
+def noise_name(name):
+    return 'Noise ' + channel_letters(name)
+
+
+#
+# parse_window_reply
+# Reads the coincidence window out of the PSoC's reply to a WIN command
+# @params: lines - lines printed by the PSoC
+# @returns: window in seconds, or None if no value with a unit was found
+def parse_window_reply(lines):
+    for line in lines:
+        match = _WINDOW_PATTERN.search(line)
+        if match:
+            return float(match.group(1)) * _UNITS[match.group(2).lower()]
+    return None
+
+
+#
+# AccidentalsEngine
+# Computes the accidentals of every selected coincident channel whose individual channels are also selected
+class AccidentalsEngine:
+    #
+    # @params: individual_channel_list / coincident_channel_list - lists of string names of the channels in use, in
+    #                                                              the order their counts appear in a sample
+    #          window - coincidence window in seconds
+    #          gate_time - seconds of counting per sample
+    def __init__(self, individual_channel_list, coincident_channel_list, window=DEFAULT_WINDOW,
+                 gate_time=DEFAULT_GATE_TIME):
+        self.window = window
+        self.gate_time = gate_time
+        self.coincident_channel_list = []     # coincident channels accidentals are computed for
+        self.channel_list = []                # names of the accidentals channels, eg 'Noise AB'
+
+        index = {}
+        for i in range(len(individual_channel_list)):
+            index[channel_letters(individual_channel_list[i])] = i
+
+        # Group the channels by how many detectors they combine, so each fold is one array operation
+        self._groups = {}                     # fold -> (output columns, sample column indices per channel)
+        for name in coincident_channel_list:
+            letters = channel_letters(name)
+            if len(letters) < 2 or any(letter not in index for letter in letters):
+                continue
+            fold = len(letters)
+            columns, members = self._groups.setdefault(fold, ([], []))
+            columns.append(len(self.channel_list))
+            members.append([index[letter] for letter in letters])
+            self.coincident_channel_list.append(name)
+            self.channel_list.append(noise_name(name))
+        for fold in self._groups:
+            columns, members = self._groups[fold]
+            self._groups[fold] = (np.array(columns), np.array(members))
+
+    def __len__(self):
+        return len(self.channel_list)
+
+    #
+    # compute
+    # @params: counts - 2d array like of shape (n_samples, n_columns) holding the individual channel counts in the
+    #                   order of individual_channel_list (extra columns are ignored)
+    # @returns: float array of shape (n_samples, len(self)) with the accidental counts per sample
+    def compute(self, counts):
+        counts = np.asarray(counts, dtype=np.float64)
+        if counts.ndim == 1:
+            counts = counts[np.newaxis, :]
+        result = np.empty((counts.shape[0], len(self.channel_list)))
+        for fold in self._groups:
+            columns, members = self._groups[fold]
+            scale = fold * (self.window / self.gate_time) ** (fold - 1)
+            result[:, columns] = scale * counts[:, members].prod(axis=2)
+        return result
+
+
+#
+# accidentals_for_run
+# Recomputes the accidentals of every coincident channel in a saved run. In a run of several devices, eg
+# 'ttyACM1: Channel AB', the accidentals are computed separately for the channels of each device
+# @params: run - structured array returned by recorder.load_run
+#          window - coincidence window in seconds
+#          gate_time - seconds of counting per sample
+# @returns: structured array with a float field per accidentals channel
+def accidentals_for_run(run, window=DEFAULT_WINDOW, gate_time=DEFAULT_GATE_TIME):
+    devices = {}
+    for name in run.dtype.names:
+        device, separator, channel = name.rpartition(': ')
+        if not channel.startswith('Noise'):
+            devices.setdefault(device + separator, []).append(name)
+
+    channel_list = []
+    columns = []
+    for prefix in devices:
+        names = devices[prefix]
+        individual_channel_list = [name for name in names if len(channel_letters(name)) == 1]
+        coincident_channel_list = [name for name in names if len(channel_letters(name)) > 1]
+        engine = AccidentalsEngine(individual_channel_list, coincident_channel_list, window, gate_time)
+        counts = np.column_stack([run[name] for name in individual_channel_list]) if individual_channel_list \
+            else np.zeros((len(run), 0))
+        values = engine.compute(counts)
+        for i in range(len(engine.channel_list)):
+            channel_list.append(prefix + engine.channel_list[i])
+            columns.append(values[:, i])
+
+    result = np.zeros(len(run), dtype=[(name, np.float64) for name in channel_list])
+    for i in range(len(channel_list)):
+        result[channel_list[i]] = columns[i]
+    return result
@@ -0,0 +1,212 @@
+# Justin Smethers
+# Purdue Fort Wayne Physics
+# Advised by Dr. Mark Masters
+
+import threading
+import time
+
+from .line_parser import LineParser, split_lines
+from .psoc_client import CommandClient, run
+
+
+'''
+Acquisition side of the Coincident Photon Counting Unit visualization.
+
+The PSoC streams one line of comma separated counters per measurement. SerialReader runs in its own thread and does
+nothing but drain those lines into a SampleRingBuffer, so a slow redraw can never stall the serial reads. It reads
+whatever the port has waiting in one go and parses the lines in batches with a LineParser. The processing thread of
+the Session consumes the buffer, and hands the samples on to the DisplaySink, which redraws at its own frame rate.
+'''
+
+
+#
+# parse_line
+# Turns one line of PSoC output into a tuple of integer counts. The line at a time path, LineParser is much faster
+# for streams of lines
+# @params: line - raw line (bytes or str) read from the PSoC
+#          n_channels - number of counters in use, extra (unused) counters on the line are ignored
+# @returns: tuple of n_channels ints
+# @raises: ValueError if the line doesn't hold n_channels integer counters
+def parse_line(line, n_channels):
+    if isinstance(line, bytes):
+        line = line.decode()
+    values = line.strip().split(', ')
+    if len(values) < n_channels:
+        raise ValueError('Expected %d counters, got %r' % (n_channels, line))
+    return tuple(int(val) for val in values[:n_channels])
+
+
+#
+# Gap
+# Stands in for samples lost from a device's stream, corrupt lines or samples dropped by a full ring buffer, so the
+# samples of several devices can be kept in step by a MergedBuffer
+class Gap:
+    __slots__ = ('count',)
+
+    #
+    # @params: count - number of samples lost
+    def __init__(self, count=1):
+        self.count = count
+
+
+#
+# SampleRingBuffer
+# Bounded single-producer / single-consumer ring buffer of parsed samples. The slots are preallocated so a
+# multi-hour run doesn't grow memory, and the consumer can drain everything that arrived since the last frame in
+# one call.
+class SampleRingBuffer:
+    #
+    # @params: capacity - max number of samples held before the producer starts overflowing
+    #          mark_gaps - store a Gap where samples were dropped, instead of closing up the stream
+    def __init__(self, capacity=65536, mark_gaps=False):
+        self.capacity = capacity
+        self.mark_gaps = mark_gaps
+        self._slots = [None] * capacity
+        self._head = 0            # index of the next slot to read
+        self._tail = 0            # index of the next slot to write
+        self._size = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        self.overflow_count = 0   # samples the producer couldn't store because the consumer was too far behind
+        self.high_watermark = 0   # largest backlog seen during the run
+        self._dropped = 0         # samples dropped since the last Gap was stored, with mark_gaps
+
+    def __len__(self):
+        return self._size
+
+    #
+    # put
+    # Store a sample. Never blocks, so the reader thread can't be held up by the renderer
+    # @params: sample - parsed sample, or a Gap
+    # @returns: True if stored, False if the buffer was full
+    def put(self, sample):
+        return self.put_many([sample]) == 1
+
+    #
+    # put_many
+    # Store several samples, taking the lock once. Never blocks
+    # @params: samples - list of parsed samples, and Gaps if mark_gaps is set
+    # @returns: number of samples stored, the rest didn't fit
+    def put_many(self, samples):
+        with self._cond:
+            if self._dropped and self._size < self.capacity:
+                # Mark where the samples that didn't fit were, before the ones that follow them
+                self._store(Gap(self._dropped))
+                self._dropped = 0
+            stored = min(len(samples), self.capacity - self._size)
+            for i in range(stored):
+                self._store(samples[i])
+            dropped = len(samples) - stored
+            if dropped:
+                self.overflow_count += dropped
+                if self.mark_gaps:
+                    self._dropped += sum(sample.count if isinstance(sample, Gap) else 1 for sample in samples[stored:])
+            if self._size > self.high_watermark:
+                self.high_watermark = self._size
+            if stored:
+                self._cond.notify()
+            return stored
+
+    def _store(self, sample):
+        self._slots[self._tail] = sample
+        self._tail = (self._tail + 1) % self.capacity
+        self._size += 1
+
+    #
+    # drain
+    # Remove every buffered sample, waiting up to timeout seconds for the first one
+    # @params: timeout - seconds to wait if the buffer is empty, None waits forever
+    # @returns: list of samples in arrival order (empty on timeout or once closed and empty)
+    def drain(self, timeout=None):
+        with self._cond:
+            if self._size == 0 and not self._closed:
+                self._cond.wait(timeout)
+            samples = []
+            while self._size:
+                samples.append(self._slots[self._head])
+                self._slots[self._head] = None
+                self._head = (self._head + 1) % self.capacity
+                self._size -= 1
+            return samples
+
+    #
+    # close
+    # Mark the end of the run. Wakes the consumer so it doesn't wait out its timeout
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    #
+    # closed
+    # @returns: True once the producer has finished and every sample has been drained
+    @property
+    def closed(self):
+        return self._closed and self._size == 0
+
+
+#
+# SerialReader
+# Producer thread. Reads from the PSoC, parses the lines and stores them in the ring buffer until the PSoC stops
+# outputting data (the read times out after STP) or stop() is called. Corrupt lines are counted and skipped.
+class SerialReader(threading.Thread):
+    #
+    # @params: ser - open serial.Serial (or anything with read and in_waiting)
+    #          buffer - SampleRingBuffer the samples are written to
+    #          n_channels - number of counters in use
+    #          telemetry - optional PipelineTelemetry the bytes, lines and parse times are reported to
+    #          parser - LineParser to use, one for n_channels counters is made by default
+    #          mark_gaps - store a Gap for every corrupt counter line, instead of closing up the stream
+    def __init__(self, ser, buffer, n_channels, telemetry=None, parser=None, mark_gaps=False):
+        threading.Thread.__init__(self, name='SerialReader', daemon=True)
+        self.ser = ser
+        self.buffer = buffer
+        self.n_channels = n_channels
+        self.telemetry = telemetry
+        self.parser = parser if parser is not None else LineParser(n_channels)
+        self.mark_gaps = mark_gaps
+        self.lines_read = 0
+        self.error = None
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def run(self):
+        rest = b''
+        try:
+            while not self._stop_event.is_set():
+                # Block for the first byte, then take everything that's already waiting
+                data = self.ser.read(self.ser.in_waiting or 1)
+                if not data:
+                    # The PSoC only goes quiet once the stop command has been executed
+                    break
+                lines, rest = split_lines(rest + data)
+                if not lines:
+                    continue
+
+                start = time.perf_counter()
+                malformed = self.parser.malformed
+                if self.mark_gaps:
+                    records = [Gap() if record is None else record for record in self.parser.parse_positions(lines)]
+                else:
+                    records = self.parser.parse_batch(lines).tolist()
+                self.lines_read += len(lines)
+                if self.telemetry is not None:
+                    self.telemetry.record_lines(len(lines), len(data), time.perf_counter() - start,
+                                                self.parser.malformed - malformed)
+                self.buffer.put_many(records)
+        except Exception as e:
+            self.error = e
+        finally:
+            self.buffer.close()
+
+
+#
+# start_acquisition
+# Turns echo off and sends the start command. The PSoC starts streaming counter lines straight after
+# @params: ser - open serial.Serial
+# @returns: none
+def start_acquisition(ser):
+    run(CommandClient(ser).start_acquisition())
+
@@ -0,0 +1,236 @@
+# Justin Smethers
+# Purdue Fort Wayne Physics
+# Advised by Dr. Mark Masters
+
+import argparse
+import csv
+import glob
+import json
+import multiprocessing
+import os
+import time
+
+import numpy as np
+
+from .accidentals import DEFAULT_GATE_TIME, DEFAULT_WINDOW, accidentals_for_run
+from .line_parser import LineParser, split_lines
+from .recorder import is_noise_channel, load_run, loaded_dtype
+from .rolling_stats import RollingStats
+
+
+'''
+Offline analysis of an archive of saved runs.
+
+Every run (.csv, including the old last_saved_run.csv layout, or .npy) is read a chunk at a time, a binary run
+memory-mapped and a csv through the same batch LineParser the live reader uses, so the size of a run doesn't matter.
+For every channel of every run the summary has the number of samples, mean, standard deviation, min, max and total
+counts and the mean rate. The accidentals are recomputed for the chosen coincidence window, and coincident channels
+get their mean accidentals, coincidence to accidental ratio and, for triples with their herald and pairs recorded,
+the heralded g2(0), all over the whole run. Runs are analysed in parallel, one per process, and written to one table.
+
+    python -m sp_visualization.analyze runs/ "archive/*.csv" --window 5 --output summary.csv
+'''
+
+SUMMARY_FIELDS = ('run', 'channel', 'samples', 'mean', 'std', 'min', 'max', 'total', 'rate_per_s', 'accidentals',
+                  'car', 'g2', 'herald', 'error')
+
+
+#
+# find_runs
+# @params: patterns - directories (every run in them is used) and glob patterns
+# @returns: sorted list of paths of runs. The level of detail tiers, sweep tables and earlier summaries are skipped
+def find_runs(patterns):
+    paths = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            pattern = os.path.join(pattern, '*')
+        for path in glob.glob(pattern):
+            name = os.path.basename(path)
+            if not name.endswith(('.csv', '.npy')) or '_lod' in name or name.startswith('sweep_') or _is_summary(path):
+                continue
+            paths.add(path)
+    return sorted(paths)
+
+
+def _is_summary(path):
+    if not path.endswith('.csv'):
+        return False
+    with open(path, newline='') as file:
+        return next(csv.reader(file), None) == list(SUMMARY_FIELDS)
+
+
+#
+# read_chunks
+# Reads a run a chunk at a time
+# @params: path - path of a .csv or .npy run
+#          chunk_size - max number of samples per chunk (csv chunks are cut at whole lines of roughly that many bytes
+#                       per channel)
+# @returns: generator of structured arrays with a field per channel
+def read_chunks(path, chunk_size=65536):
+    if path.endswith('.npy'):
+        run = load_run(path)
+        for start in range(0, len(run), chunk_size):
+            yield run[start:start + chunk_size]
+        return
+
+    with open(path, 'rb') as file:
+        channel_list = next(csv.reader([file.readline().decode()]))
+        if channel_list and channel_list[-1] == 'Count':
+            channel_list = channel_list[:-1]
+        # The old save_data started every channel with a placeholder 1, which isn't a sample
+        offset = file.tell()
+        if not _is_placeholder(next(csv.reader([file.readline().decode()]), [])):
+            file.seek(offset)
+        dtype = loaded_dtype(channel_list)
+        parser = LineParser(len(channel_list), np.float64 if any(map(is_noise_channel, channel_list)) else np.int64)
+        rest = b''
+        while True:
+            data = file.read(chunk_size * 8 * max(1, len(channel_list)))
+            if not data:
+                lines, rest = [rest] if rest.strip() else [], b''
+            else:
+                lines, rest = split_lines(rest + data)
+            values = parser.parse_batch(lines)
+            if len(values):
+                chunk = np.zeros(len(values), dtype=dtype)
+                for i in range(len(channel_list)):
+                    chunk[channel_list[i]] = values[:, i]
+                yield chunk
+            if not data:
+                break
+
+
+#
+# _is_placeholder
+# Tells the placeholder row of the old last_saved_run.csv layout by its content, so a renamed file is still read right
+# @params: fields - fields of the first row of a csv run
+# @returns: True if every field, Count included, is 1
+def _is_placeholder(fields):
+    return bool(fields) and all(field.strip() == '1' for field in fields)
+
+
+#
+# analyze_run
+# @params: path - path of a .csv or .npy run
+#          window - coincidence window in seconds
+#          gate_time - seconds of counting per sample
+#          chunk_size - number of samples read at a time
+# @returns: list of summary rows (dicts with the SUMMARY_FIELDS), one per channel
+def analyze_run(path, window=DEFAULT_WINDOW, gate_time=DEFAULT_GATE_TIME, chunk_size=65536):
+    stats = None
+    channel_list = None
+    for chunk in read_chunks(path, chunk_size):
+        # Recompute the accidentals instead of trusting the recorded ones, which may have used another window
+        noise = accidentals_for_run(chunk, window, gate_time)
+        names = [name for name in chunk.dtype.names if not is_noise_channel(name)]
+        columns = [chunk[name] for name in names] + [noise[name] for name in noise.dtype.names]
+        rows = np.column_stack(columns).astype(np.float64) if columns else np.zeros((len(chunk), 0))
+        if stats is None:
+            channel_list = names + list(noise.dtype.names)
+            stats = RollingStats(channel_list, window=1, gate_time=gate_time)
+            totals = np.zeros(len(channel_list))
+            minimum = np.full(len(channel_list), np.inf)
+            maximum = np.full(len(channel_list), -np.inf)
+        stats.update(rows)
+        totals += rows.sum(axis=0)
+        if len(rows):
+            minimum = np.minimum(minimum, rows.min(axis=0))
+            maximum = np.maximum(maximum, rows.max(axis=0))
+
+    if stats is None or stats.count == 0:
+        return [{'run': path, 'error': 'no samples'}]
+
+    std = stats.std
+    summary = []
+    for i in range(len(channel_list)):
+        summary.append({'run': path, 'channel': channel_list[i], 'samples': stats.count, 'mean': stats.mean[i],
+                        'std': std[i], 'min': minimum[i], 'max': maximum[i], 'total': totals[i],
+                        'rate_per_s': totals[i] / (stats.count * gate_time)})
+    # The ratios are taken over the whole run, from the totals
+    for coincident, noise in stats.car_channels:
+        row = summary[coincident]
+        row['accidentals'] = stats.mean[noise]
+        row['car'] = totals[coincident] / totals[noise] if totals[noise] else None
+    for j in range(len(stats.g2_channels)):
+        herald, pair_a, pair_b, triple = stats.g2_channels[j]
+        row = summary[triple]
+        if 'g2' in row or not totals[pair_a] * totals[pair_b]:
+            continue
+        row['g2'] = totals[herald] * totals[triple] / (totals[pair_a] * totals[pair_b])
+        row['herald'] = stats.g2_labels[j]
+    return summary
+
+
+#
+# _analyze
+# Pool worker: analyze_run that reports an error instead of raising
+def _analyze(task):
+    path, window, gate_time = task
+    try:
+        return analyze_run(path, window, gate_time)
+    except Exception as e:
+        return [{'run': path, 'error': repr(e)}]
+
+
+#
+# analyze_runs
+# Analyses every run, several at a time
+# @params: paths - list of paths of runs
+#          window - coincidence window in seconds
+#          gate_time - seconds of counting per sample
+#          jobs - number of processes, the number of cores by default
+# @returns: list of summary rows of every run, in the order of paths
+def analyze_runs(paths, window=DEFAULT_WINDOW, gate_time=DEFAULT_GATE_TIME, jobs=None):
+    tasks = [(path, window, gate_time) for path in paths]
+    if jobs == 1 or len(tasks) < 2:
+        results = [_analyze(task) for task in tasks]
+    else:
+        with multiprocessing.get_context('spawn').Pool(jobs) as pool:
+            # One run per task, so a long run doesn't hold up a batch of short ones
+            results = pool.map(_analyze, tasks, chunksize=1)
+    return [row for rows in results for row in rows]
+
+
+#
+# write_summary
+# @params: summary - list of summary rows
+#          path - .csv or .json file to write
+# @returns: none
+def write_summary(summary, path):
+    if path.endswith('.json'):
+        with open(path, 'w') as file:
+            json.dump(summary, file, indent=2, default=float)
+        return
+    with open(path, 'w', newline='') as file:
+        writer = csv.DictWriter(file, SUMMARY_FIELDS)
+        writer.writeheader()
+        for row in summary:
+            writer.writerow(dict((key, '%.6g' % value if isinstance(value, (float, np.floating)) else value)
+                                 for key, value in row.items()))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Summarize an archive of saved runs')
+    parser.add_argument('runs', nargs='+', help='directories or glob patterns of .csv/.npy runs')
+    parser.add_argument('--window', type=float, default=DEFAULT_WINDOW * 1e9, help='coincidence window in ns')
+    parser.add_argument('--gate-time', type=float, default=DEFAULT_GATE_TIME, help='seconds of counting per sample')
+    parser.add_argument('--jobs', type=int, help='number of processes, the number of cores by default')
+    parser.add_argument('--output', default='summary.csv', help='summary table to write, .csv or .json')
+    args = parser.parse_args(argv)
+
+    paths = find_runs(args.runs)
+    if not paths:
+        parser.error('no runs found')
+    print('Analysing %d runs...' % len(paths))
+    start = time.perf_counter()
+    summary = analyze_runs(paths, args.window * 1e-9, args.gate_time, args.jobs)
+    write_summary(summary, args.output)
+    errors = [row for row in summary if row.get('error')]
+    for row in errors:
+        print('Failed to analyse', row['run'] + ':', row['error'])
+    print('Summary of %d runs written to %s in %.1f s' % (len(paths) - len(errors), args.output,
+                                                           time.perf_counter() - start))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,309 @@
+# Justin Smethers
+# Purdue Fort Wayne Physics
+# Advised by Dr. Mark Masters
+
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+try:
+    import resource
+except ImportError:       # Windows
+    resource = None
+
+import numpy as np
+
+from .accidentals import AccidentalsEngine
+from .acquisition import SampleRingBuffer, SerialReader, parse_line, start_acquisition
+from .line_parser import LineParser
+from .recorder import open_recorder
+from .replay import PoissonSource, ReplaySerial, letters_chn
+
+
+'''
+Throughput and latency benchmark of the acquisition to display pipeline.
+
+Each case drives the real pipeline (SerialReader -> SampleRingBuffer -> accidentals -> LivePlotter -> recorder) from a
+simulated PSoC sending lines at a target rate, for a fixed number of seconds, with 1 to 4 individual channels plus
+every coincidence combination of them (up to 11). It reports the sustained samples per second, latency percentiles
+of each stage, the samples dropped or left backlogged in the ring buffer, and the peak RSS. Every case runs in a
+fresh process so the RSS numbers don't leak between cases.
+
+    python -m sp_visualization.benchmark --rates 100 1000 10000 0 --singles 1 2 3 4 --json results.json
+
+A rate of 0 sends lines as fast as the pipeline reads them. The parse stage is reported per line. --parsers compares
+the line at a time parse_line with LineParser's batch parsing instead. Results from different versions can be compared with
+the --json files.
+'''
+
+LETTERS = 'ABCD'
+STAGES = ('parse', 'noise', 'accumulate', 'render', 'save')
+
+
+#
+# channel_lists
+# @params: n_singles - number of individual channels, 1 to 4
+# @returns: individual_channel_list, coincident_channel_list - the first n_singles channels and every combination
+#           of two or more of them
+def channel_lists(n_singles):
+    letters = LETTERS[:n_singles]
+    individual_channel_list = ['Channel ' + letter for letter in letters]
+    coincident_channel_list = []
+    for fold in range(2, n_singles + 1):
+        for combination in itertools.combinations(letters, fold):
+            coincident_channel_list.append('Channel ' + ''.join(combination))
+    return individual_channel_list, coincident_channel_list
+
+
+#
+# TimedLineParser
+# LineParser that also records how long each batch took to parse, per line
+class TimedLineParser(LineParser):
+    def __init__(self, n_channels):
+        LineParser.__init__(self, n_channels)
+        self.parse_times = []
+
+    def parse_batch(self, lines):
+        start = time.perf_counter()
+        records = LineParser.parse_batch(self, lines)
+        if lines:
+            self.parse_times.append((time.perf_counter() - start) / len(lines))
+        return records
+
+
+#
+# compare_parsers
+# Times the line at a time parse_line against LineParser.parse_batch on the same synthetic lines
+# @params: n_lines - number of lines
+#          n_counters - counters per line, as printed by the PSoC
+#          n_channels - counters in use
+#          corrupt_every - every corrupt_every-th line is corrupt, 0 for none
+#          batch_size - lines per parse_batch call
+# @returns: dict of results
+def compare_parsers(n_lines=200000, n_counters=16, n_channels=15, corrupt_every=0, batch_size=256):
+    rng = np.random.default_rng(0)
+    counts = rng.poisson(50000, (n_lines, n_counters))
+    lines = [(', '.join(map(str, row)) + '\r\n').encode() for row in counts.tolist()]
+    if corrupt_every:
+        for i in range(0, n_lines, corrupt_every):
+            lines[i] = lines[i][:len(lines[i]) // 2] + b'\x00#' + lines[i][len(lines[i]) // 2:]
+
+    start = time.perf_counter()
+    parsed = 0
+    for line in lines:
+        try:
+            parse_line(line, n_channels)
+            parsed += 1
+        except ValueError:
+            pass
+    line_time = time.perf_counter() - start
+
+    parser = LineParser(n_channels)
+    start = time.perf_counter()
+    for i in range(0, n_lines, batch_size):
+        parser.parse_batch(lines[i:i + batch_size])
+    batch_time = time.perf_counter() - start
+
+    return {'lines': n_lines, 'corrupt_every': corrupt_every, 'parse_line_per_s': n_lines / line_time,
+            'parse_batch_per_s': n_lines / batch_time, 'speedup': line_time / batch_time,
+            'malformed': parser.malformed}
+
+
+#
+# percentiles
+# @params: times - list of durations in seconds
+# @returns: dict of latency percentiles in microseconds
+def percentiles(times):
+    if not times:
+        return None
+    values = np.percentile(np.array(times) * 1e6, [50, 90, 99, 100])
+    return {'p50_us': values[0], 'p90_us': values[1], 'p99_us': values[2], 'max_us': values[3]}
+
+
+#
+# peak_rss
+# @returns: peak resident set size of this process in MB, None where the resource module isn't available
+def peak_rss():
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return rss / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+
+#
+# run_case
+# Runs the pipeline for one rate and channel count
+# @params: rate - target lines per second, 0 for as fast as possible
+#          n_singles - number of individual channels
+#          duration - seconds to run for
+#          render - draw the figure (with the Agg backend), otherwise the render stage is skipped
+#          save_format - format the recorder writes
+#          frame_rate - max number of redraws per second, as the max_fps of a DisplaySink
+# @returns: dict of results
+def run_case(rate, n_singles, duration=3.0, render=True, save_format='csv', frame_rate=20):
+    individual_channel_list, coincident_channel_list = channel_lists(n_singles)
+    n_counters = len(individual_channel_list) + len(coincident_channel_list)
+
+    ser = ReplaySerial(PoissonSource(seed=0), line_rate=rate or None)
+    ser.open()
+    for i in range(n_counters):
+        letters = (individual_channel_list + coincident_channel_list)[i].split()[-1]
+        ser.write(("CTR" + str(i) + "\r\n").encode())
+        ser.write(("CHN" + letters_chn(letters) + "\r\n").encode())
+
+    engine = AccidentalsEngine(individual_channel_list, coincident_channel_list)
+    channel_list = individual_channel_list + coincident_channel_list + engine.channel_list
+    plotter = None
+    if render:
+        import matplotlib
+        matplotlib.use('Agg')
+        from .plotting import LivePlotter, build_figure
+        fig, incident, coincident, legend = build_figure()
+        plotter = LivePlotter(fig, incident, coincident, individual_channel_list,
+                              coincident_channel_list + engine.channel_list)
+
+    times = dict((stage, []) for stage in STAGES)
+    clock = time.perf_counter
+    with tempfile.TemporaryDirectory() as directory:
+        recorder = open_recorder(channel_list, directory, save_format)
+        buffer = SampleRingBuffer()
+        parser = TimedLineParser(n_counters)
+        reader = SerialReader(ser, buffer, n_counters, parser=parser)
+
+        # Start the stream only now, so nothing is generated while the figure and the recorder are built
+        consumed = 0
+        start_acquisition(ser)
+        started = clock()
+        reader.start()
+        stopping = False
+        while True:
+            if not stopping and clock() - started >= duration:
+                ser.write('STP\r\n'.encode())
+                stopping = True
+            samples = buffer.drain(timeout=1 / frame_rate)
+            if not samples:
+                if buffer.closed:
+                    break
+                continue
+
+            start = clock()
+            counts = np.array(samples, dtype=np.int64)
+            noise = engine.compute(counts)
+            rows = np.hstack([counts, noise])
+            times['noise'].append(clock() - start)
+
+            if plotter is not None:
+                # Like the DisplaySink, only the rows that can still be on screen are added
+                start = clock()
+                plotter.skip(max(0, len(rows) - plotter.window_size))
+                for values in rows[-plotter.window_size:].tolist():
+                    plotter.append(values)
+                times['accumulate'].append(clock() - start)
+                start = clock()
+                plotter.render()
+                times['render'].append(clock() - start)
+
+            start = clock()
+            recorder.extend(rows)
+            times['save'].append(clock() - start)
+            consumed += len(samples)
+        elapsed = clock() - started
+        recorder.close()
+    reader.join()
+    times['parse'] = parser.parse_times
+
+    result = {
+        'target_rate': rate,
+        'n_singles': n_singles,
+        'n_coincidences': len(coincident_channel_list),
+        'render': render,
+        'save_format': save_format,
+        'duration_s': elapsed,
+        'samples': consumed,
+        'samples_per_s': consumed / elapsed,
+        'dropped': buffer.overflow_count,
+        'max_backlog': buffer.high_watermark,
+        'peak_rss_mb': peak_rss(),
+        'stages': dict((stage, percentiles(times[stage])) for stage in STAGES),
+    }
+    if reader.error is not None:
+        result['error'] = repr(reader.error)
+    return result
+
+
+#
+# version_info
+# @returns: dict describing the code and machine the benchmark ran on
+def version_info():
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL,
+                                         cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'commit': commit, 'python': platform.python_version(), 'numpy': np.__version__,
+            'machine': platform.platform(), 'time': time.strftime('%Y-%m-%dT%H:%M:%S')}
+
+
+#
+# print_result
+# Prints one case as a line of the results table
+def print_result(result):
+    rate = result['target_rate'] or 'max'
+    stages = result['stages']
+    p99 = ' '.join('%9.1f' % stages[stage]['p99_us'] if stages[stage] else '%9s' % '-' for stage in STAGES)
+    print('%8s %3d+%-2d %11.0f %8d %8d %8.1f  %s' % (rate, result['n_singles'], result['n_coincidences'],
+                                                     result['samples_per_s'], result['dropped'],
+                                                     result['max_backlog'], result['peak_rss_mb'] or 0, p99))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the acquisition to display pipeline')
+    parser.add_argument('--rates', type=float, nargs='+', default=[100, 1000, 10000, 0],
+                        help='target lines per second, 0 for as fast as possible')
+    parser.add_argument('--singles', type=int, nargs='+', default=[1, 2, 3, 4], choices=[1, 2, 3, 4],
+                        help='numbers of individual channels (every coincidence combination of them is added)')
+    parser.add_argument('--duration', type=float, default=3.0, help='seconds per case')
+    parser.add_argument('--no-render', action='store_true', help='skip the plotting stages')
+    parser.add_argument('--format', default='csv', choices=['csv', 'npy'], help='format the recorder writes')
+    parser.add_argument('--parsers', action='store_true', help='only compare parse_line with LineParser')
+    parser.add_argument('--json', metavar='PATH', help='write the results to a json file')
+    args = parser.parse_args(argv)
+
+    results = []
+    if args.parsers:
+        for corrupt_every in (0, 1000, 10):
+            result = compare_parsers(corrupt_every=corrupt_every)
+            print('corrupt every %4s lines: parse_line %9.0f lines/s  LineParser %9.0f lines/s  (%.1fx)' % (
+                corrupt_every or '-', result['parse_line_per_s'], result['parse_batch_per_s'], result['speedup']))
+            results.append(result)
+        if args.json:
+            with open(args.json, 'w') as file:
+                json.dump({'version': version_info(), 'parsers': results}, file, indent=2, default=float)
+        return
+
+    print('%8s %6s %11s %8s %8s %8s  %s' % ('rate', 'chans', 'samples/s', 'dropped', 'backlog', 'rss MB',
+                                             ' '.join('%9s' % (stage + ' p99') for stage in STAGES)))
+    context = multiprocessing.get_context('spawn')
+    for n_singles in args.singles:
+        for rate in args.rates:
+            with context.Pool(1) as pool:
+                result = pool.apply(run_case, (rate, n_singles, args.duration, not args.no_render, args.format))
+            print_result(result)
+            results.append(result)
+
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump({'version': version_info(), 'results': results}, file, indent=2, default=float)
+        print('Results written to', args.json)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,252 @@
+# Justin Smethers
+# Purdue Fort Wayne Physics
+# Advised by Dr. Mark Masters
+
+import argparse
+import os
+
+from .multidevice import discover_ports, open_ports
+from .recorder import SAVE_FORMATS, recover_runs
+from .replay import PoissonSource, ReplaySerial, RunFileSource
+from .session import Session
+from .sweep import SweepError, parse_sweep, plot_sweep, sweep_file_name, write_sweep
+from .telemetry import format_telemetry
+
+
+'''
+This script interacts with the PSoC device in Dr. Masters' lab as part of the Coincident Photon Counting Unit. 
+It's designed to take the data output by the PSoC and graph it, calculate the number of accidental coincident photons, 
+and stream the data to a timestamped csv file per run. The serial port and the figure are kept open by a Session, so
+'sta' can be run as many times as needed, with different channels each time.
+
+For every coincident channel whose individual channels are selected too (eg A, B, AB) the script displays the number
+of accidental coincident photons as 'Noise' (eg 'Noise AB'). The coincidence window is taken from the last WIN reply
+
+There must be at least one channel selected, as well as one coincident channel (eg A, AB)
+
+Several PSoC units can be run at once with --port given once per unit, or --discover. Their channels are plotted and
+saved together, prefixed with the port name (eg 'ttyACM1: Channel A'), and each unit can be given its own channels
+by separating them with ';' (eg 'A,B,AB;C,D,CD')
+
+With --headless nothing is drawn (and matplotlib isn't loaded), the runs are only recorded, for long unattended runs.
+'dsp on' and 'dsp off' open and close the figure at any time, also during a run, and 'dsp 5' limits it to 5 redraws
+per second. Neither affects what is recorded
+
+'swp <setting> <start> <stop> <step> [samples per step]' (eg 'swp dac 100 200 10') sweeps a PSoC setting, eg the DAC
+threshold or the coincidence window (WIN, in ns), over a range without stopping the acquisition between the steps. The
+mean counts, accidentals and CAR at every step are saved to a sweep_*.csv table and plotted to a .png of the same name
+
+Nothing slow happens before the prompt: the serial ports are only opened (and echo turned on) by the first command
+that needs them, and matplotlib is only loaded when the first run is plotted.
+'''
+
+#
+# display_command
+# Handles 'dsp on', 'dsp off' and 'dsp <max redraws per second>'
+# @params: session - Session
+#          entry - command entered by the user
+# @returns: none
+def display_command(session, entry):
+    argument = entry[3:].strip().lower()
+    if argument == 'on':
+        session.attach_display()
+    elif argument == 'off':
+        session.detach_display()
+    elif argument:
+        try:
+            frame_rate = float(argument)
+        except ValueError:
+            frame_rate = 0
+        if not frame_rate > 0:
+            print("Use 'dsp on', 'dsp off' or 'dsp <max redraws per second>', with more than 0 redraws per second")
+            return
+        session.frame_rate = frame_rate
+        if session.display is not None:
+            session.display.max_fps = session.frame_rate
+    if session.display is None:
+        print('Display off')
+    else:
+        print('Display on, at most %g redraws per second' % session.display.max_fps)
+
+
+#
+# sweep_command
+# Handles 'swp <setting> <start> <stop> <step> [samples per step]'
+# @params: session - Session
+#          entry - command entered by the user
+#          plot - also plot the sweep to a .png
+# @returns: none
+def sweep_command(session, entry, plot):
+    try:
+        parameter, values, n_samples = parse_sweep(entry)
+    except ValueError as e:
+        print(e)
+        return
+    chosen_channels = input('Enter channels to be used: (eg \'A,B,C,ABC\')\n')
+    print('Sweeping %s over %d steps of %d samples...' % (parameter, len(values), n_samples))
+    try:
+        result = session.sweep(chosen_channels, parameter, values, n_samples)
+    except ValueError as e:
+        # eg channels given for another number of devices
+        print(e)
+        return
+    except SweepError as e:
+        print('Sweep stopped:', e)
+        result = e.result
+    if result.completed == 0:
+        print('No step of the sweep finished, nothing saved')
+        return
+    path = sweep_file_name(parameter, session.directory)
+    write_sweep(result, path)
+    print('Saved sweep to', path)
+    if plot:
+        plot_sweep(result, os.path.splitext(path)[0] + '.png')
+        print('Plotted sweep to', os.path.splitext(path)[0] + '.png')
+
+
+# Commands that are passed straight through to the PSoC, with its reply printed
+PSOC_COMMANDS = ('HLP', 'SCN', 'CHN', 'CTR', 'LSC', 'LVL', 'DAC', 'COL', 'WIN', 'ECO', 'MAXDV', 'MINDV')
+
+
+#
+# open_devices
+# Opens the devices chosen on the command line. Passed to the Session, which calls it on the first command
+# @params: args - parsed command line
+# @returns: list of open serial connections (or ReplaySerial)
+def open_devices(args):
+    if args.replay:
+        devices = [ReplaySerial(RunFileSource(args.replay), line_rate=args.line_rate or None)]
+    elif args.simulate:
+        devices = [ReplaySerial(PoissonSource(seed=i), line_rate=args.line_rate or None) for i in range(args.devices)]
+        for i in range(len(devices)):
+            devices[i].port = 'sim%d' % i
+    else:
+        ports = args.port or (discover_ports() if args.discover else ["/dev/ttyACM0"])
+        if not ports:
+            raise OSError('no PSoC found')
+        devices = open_ports(ports)
+    for ser in devices:
+        if not ser.is_open:
+            ser.timeout = 1
+            ser.open()
+    if len(devices) > 1:
+        print('Running', len(devices), 'devices:', ', '.join(ser.port for ser in devices))
+    return devices
+
+
+#
+# stop_run
+# Stops the run and reports how it went
+# @params: session - Session
+# @returns: none
+def stop_run(session):
+    print('\n')
+    print('Stopping run...')
+    still_running = session.stop()
+    for reader in session.readers:
+        if reader.error is not None:
+            print(reader.name, 'stopped on an error:', reader.error)
+    if session.error is not None:
+        print('Plotting stopped on an error:', session.error)
+
+    buffer = session.buffer
+    if buffer.overflow_count:
+        print('\n---------------------------------------------------------------------------------')
+        print("WARNING %d points were dropped because processing fell %d points behind" % (buffer.overflow_count, buffer.capacity))
+        print('---------------------------------------------------------------------------------\n')
+    else:
+        print('Largest backlog between readers and processing: %d points' % buffer.high_watermark)
+    if getattr(buffer, 'padded', 0):
+        print('%d points were completed with zeros because a device stopped early' % buffer.padded)
+    if getattr(buffer, 'gapped', 0):
+        print('%d points were dropped because a device lost its part of them' % buffer.gapped)
+    if session.telemetry.latest is not None:
+        print(format_telemetry(session.telemetry.latest))
+    print(session.stats.summary())
+
+    if still_running:
+        print('Failed to stop:', ', '.join(still_running))
+    else:
+        print('Run stopped')
+
+
+def main(argv=None):
+    # Without options the script talks to the PSoC. --replay and --simulate stand in for it, eg to profile the script
+    parser = argparse.ArgumentParser(description='Coincident Photon Counting Unit visualization')
+    parser.add_argument('--replay', metavar='RUN', help='replay a saved .csv or .npy run instead of reading the PSoC')
+    parser.add_argument('--simulate', action='store_true', help='simulate Poisson distributed counts instead of reading the PSoC')
+    parser.add_argument('--line-rate', type=float, default=10, help='lines per second sent by --replay/--simulate, 0 for as fast as possible')
+    parser.add_argument('--port', action='append', help='serial port of a PSoC, repeat to run several at once (default /dev/ttyACM0)')
+    parser.add_argument('--discover', action='store_true', help='run every PSoC connected to this computer')
+    parser.add_argument('--headless', action='store_true', help='only record the runs, without plotting them')
+    parser.add_argument('--frame-rate', type=float, default=10, help='max redraws per second of the figure')
+    parser.add_argument('--devices', type=int, default=1, help='number of PSoC units simulated by --simulate')
+    args = parser.parse_args(argv)
+    if not args.frame_rate > 0:
+        parser.error('--frame-rate must be more than 0')
+
+    # Finish any runs that were cut off by a crash or power loss
+    for path in recover_runs():
+        print('Recovered interrupted run', path)
+
+    # The session keeps the port, the figure and the settings (save format, coincidence window) between runs. It
+    # opens the port and turns echo on when the first command needs it
+    session = Session(lambda: open_devices(args), frame_rate=args.frame_rate, headless=args.headless,
+                      connect_commands=("ECO 1",))
+
+    # Wait for user input - for use in outputting multiple commands to the control device
+    print("\nType 'sta' to start plotting")
+    print("Type 'hlp' for list of commands")
+    print("Type 'fmt csv' or 'fmt npy' to choose the format runs are saved in")
+    print("Type 'dsp on', 'dsp off' or 'dsp <fps>' to open, close or slow down the figure")
+    print("Type 'swp <setting> <start> <stop> <step> [samples]' to sweep a setting, eg 'swp dac 100 200 10'")
+    entry = input("\nEnter command, or q to quit: ")
+
+    while entry != "q":
+        try:
+            # Code to run if user inputs "sta" to start
+            if entry.upper().startswith("STA"):
+                # Allow user to enter channels to collect data from
+                chosen_channels = input('Enter channels to be used: (eg \'A,B,C,ABC\')\n')
+                try:
+                    session.start(chosen_channels)
+                except ValueError as e:
+                    # eg channels given for another number of devices
+                    print(e)
+                else:
+                    while True:
+                        # Main thread waits in this loop
+                        print('\nType STP to exit')
+                        entry = input()
+                        if entry.upper().startswith("DSP"):
+                            display_command(session, entry)
+                        elif entry.upper() == "STP":
+                            stop_run(session)
+                            break
+            elif entry.upper().startswith("DSP"):
+                display_command(session, entry)
+            elif entry.upper().startswith("SWP"):
+                sweep_command(session, entry, plot=not args.headless)
+            elif entry.upper().startswith("FMT"):
+                # Choose the format runs are saved in. Handled here, not by the PSoC
+                chosen_format = entry[3:].strip().lower()
+                if chosen_format in SAVE_FORMATS:
+                    session.save_format = chosen_format
+                elif chosen_format:
+                    print('Unknown format, choose one of:', ', '.join(SAVE_FORMATS))
+                print('Runs are saved as', session.save_format)
+            elif entry.upper().startswith(PSOC_COMMANDS):
+                window = session.coincidence_window
+                for output in session.command(entry):
+                    print(output)
+                if session.coincidence_window != window:
+                    print('Using a %g s coincidence window for the accidentals' % session.coincidence_window)
+            else:
+                print("Invalid command in this context")
+        except OSError as e:
+            # eg the PSoC isn't plugged in. serial.SerialException is an OSError too
+            print("Couldn't talk to the PSoC:", e)
+
+        entry = input("\nEnter command, or q to quit: ")
+    session.close()
+    print("Quitting...")
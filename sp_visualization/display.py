@@ -0,0 +1,210 @@
+# Justin Smethers
+# Purdue Fort Wayne Physics
+# Advised by Dr. Mark Masters
+
+import multiprocessing
+import threading
+import time
+from collections import deque
+
+
+'''
+Optional live display of a run.
+
+Acquisition doesn't draw anything itself. It hands every processed batch to the DisplaySink attached to the Session,
+if there is one, which only keeps the last window_size rows and returns straight away. The sink's own thread hands
+the latest rows to the figure at most max_fps times per second however fast the samples come in, so the display can
+be attached, detached or slowed down during a run without affecting what is read and recorded.
+
+The figure itself is drawn by a separate process, in that process's main thread. GUI toolkits like Tk and Qt must
+only be used from the main thread, and the main thread of the script is busy waiting for commands in input(). The
+sink's thread sends each frame through a pipe and waits for the process to draw it before sending the next, so a
+slow figure only makes the frames less frequent. matplotlib is only imported by the display process, a headless
+Session never loads it.
+'''
+
+DEFAULT_FPS = 10              # redraws per second used if max_fps isn't a positive number
+
+
+#
+# DisplaySink
+# Draws the rows pushed to it with a LivePlotter, at a limited refresh rate
+class DisplaySink:
+    #
+    # @params: window_size - max number of points per plot
+    #          max_fps - max number of redraws per second, DEFAULT_FPS if it isn't above 0
+    #          blit - only redraw the lines and captions each frame instead of the whole figure
+    def __init__(self, window_size=50, max_fps=DEFAULT_FPS, blit=True):
+        self.window_size = window_size
+        self.max_fps = max_fps
+        self.blit = blit
+
+        self._lock = threading.Lock()
+        self._rows = deque(maxlen=window_size)
+        self._received = 0        # rows pushed since the last frame, including the ones that fell out of _rows
+        self._channels = None     # channel lists of a run that hasn't been shown yet
+        self._telemetry = None
+        self._status = None
+        self._annotations = None
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    #
+    # start_run
+    # Shows a new run, possibly with different channels
+    # @params: individual_channel_list / coincident_channel_list - string names of the channels plotted on each panel,
+    #                                                              in the order their values are pushed
+    #          telemetry - PipelineTelemetry of the run, the frames drawn are recorded to it
+    # @returns: none
+    def start_run(self, individual_channel_list, coincident_channel_list, telemetry=None):
+        self._telemetry = telemetry
+        with self._lock:
+            self._channels = (list(individual_channel_list), list(coincident_channel_list))
+            self._rows.clear()
+            self._received = 0
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='Display', daemon=True)
+            self._thread.start()
+
+    #
+    # push
+    # Called by acquisition with every processed batch. Never waits for the figure
+    # @params: rows - list or 2d array of rows of counts in panel order
+    # @returns: none
+    def push(self, rows):
+        with self._lock:
+            # Only the rows that can still be on screen are kept
+            self._rows.extend(rows[-self.window_size:])
+            self._received += len(rows)
+
+    #
+    # set_status
+    # @params: text - text of the status panel, shown with the next frame
+    # @returns: none
+    def set_status(self, text):
+        self._status = text
+
+    #
+    # set_annotations
+    # @params: annotations - dict of channel name to extra caption text, shown with the next frame
+    # @returns: none
+    def set_annotations(self, annotations):
+        self._annotations = annotations
+
+    #
+    # close
+    # Stops the display thread and closes the figure and its process
+    # @params: timeout - seconds to wait for the display thread
+    # @returns: none
+    def close(self, timeout=5):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    #
+    # _run
+    # Target of the display thread. Starts the display process and sends it whatever was pushed since the last frame,
+    # once it has drawn that frame
+    def _run(self):
+        context = multiprocessing.get_context('spawn')
+        connection, child_connection = context.Pipe()
+        process = context.Process(target=_show, args=(child_connection, self.window_size, self.blit),
+                                  name='Display', daemon=True)
+        process.start()
+        drawing = False           # a frame has been sent and not drawn yet
+        status = None
+        annotations = None
+        try:
+            while not self._stop_event.is_set() and process.is_alive():
+                frame_start = time.perf_counter()
+                if drawing and connection.poll():
+                    frame_time = connection.recv()
+                    drawing = False
+                    if frame_time is not None and self._telemetry is not None:
+                        self._telemetry.record_frame(frame_time)
+
+                if not drawing:
+                    frame = {}
+                    with self._lock:
+                        if self._channels is not None:
+                            frame['channels'] = self._channels
+                            status = annotations = None
+                        if self._rows:
+                            frame['rows'] = [list(values) for values in self._rows]
+                            frame['received'] = self._received
+                        self._channels = None
+                        self._rows.clear()
+                        self._received = 0
+                    if 'rows' in frame:
+                        if self._status is not status:
+                            status = frame['status'] = self._status
+                        if self._annotations is not annotations:
+                            annotations = frame['annotations'] = self._annotations
+                    if frame:
+                        connection.send(frame)
+                        drawing = True
+
+                max_fps = self.max_fps if self.max_fps > 0 else DEFAULT_FPS
+                self._stop_event.wait(max(0.0, 1 / max_fps - (time.perf_counter() - frame_start)))
+        finally:
+            try:
+                connection.send(None)
+            except OSError:
+                pass
+            process.join(5)
+            if process.is_alive():
+                process.terminate()
+            connection.close()
+
+
+#
+# _show
+# Target of the display process. Builds the figure and draws every frame sent by the DisplaySink, keeping the window
+# responsive in between
+# @params: connection - end of the pipe the frames arrive on, a frame of None closes the figure
+#          window_size - max number of points per plot
+#          blit - only redraw the lines and captions each frame instead of the whole figure
+# @returns: none
+def _show(connection, window_size, blit):
+    import matplotlib.pyplot as plt
+    from .plotting import LivePlotter, build_figure
+
+    fig, incident, coincident, legend = build_figure()
+    plotter = None
+    try:
+        while True:
+            if not connection.poll(0.02):
+                fig.canvas.flush_events()
+                continue
+            frame = connection.recv()
+            if frame is None:
+                break
+
+            frame_start = time.perf_counter()
+            channels = frame.get('channels')
+            if channels is not None:
+                if plotter is None:
+                    plotter = LivePlotter(fig, incident, coincident, channels[0], channels[1], window_size=window_size,
+                                          blit=blit, status=legend)
+                else:
+                    plotter.reset(*channels)
+            rows = frame.get('rows')
+            if plotter is None or not rows:
+                connection.send(None)
+                continue
+
+            # Rows that fell out of the window before they were shown still count towards the x axis
+            plotter.skip(frame['received'] - len(rows))
+            for values in rows:
+                plotter.append(values)
+            if 'status' in frame:
+                plotter.set_status(frame['status'])
+            if 'annotations' in frame:
+                plotter.set_annotations(frame['annotations'])
+            plotter.render()
+            connection.send(time.perf_counter() - frame_start)
+    except (EOFError, OSError):
+        # The session went away without closing the display
+        pass
+    finally:
+        plt.close(fig)
@@ -0,0 +1,184 @@
+# Justin Smethers
+# Purdue Fort Wayne Physics
+# Advised by Dr. Mark Masters
+
+import argparse
+import csv
+import os
+
+import numpy as np
+
+from .recorder import LOD_FACTORS, LodPyramid, load_run, loaded_dtype, lod_path
+
+
+'''
+Whole-run view of a saved run.
+
+The live plots only show the last few points. RunHistory shows any stretch of a run, up to all of it, with a bounded
+number of points by reading the level of detail tiers the recorder keeps next to the run (the min, max and mean of
+every 10, 100 and 1000 samples). It picks the finest tier that fits max_points for the range asked for, and only goes
+back to the run file itself when the range is short enough to show every sample. The tiers are memory-mapped, so
+only the bins that are shown are read from disk.
+
+Runs recorded before the tiers existed get them built by build_lod on first use, as do runs whose tiers don't cover
+every sample of the run.
+
+    python -m sp_visualization.history run_20240131_142501.npy --channels "Channel AB" "Noise AB"
+'''
+
+
+#
+# build_lod
+# Builds the level of detail tiers of a saved run, reading it in chunks
+# @params: path - path of a .csv or .npy run
+#          factors - samples per bin of each tier
+#          chunk_size - number of samples read at a time
+# @returns: list of paths of the tiers
+def build_lod(path, factors=LOD_FACTORS, chunk_size=65536):
+    if path.endswith('.npy'):
+        run = load_run(path)
+        channel_list = list(run.dtype.names)
+        pyramid = LodPyramid(channel_list, path, factors, chunk_size)
+        for start in range(0, len(run), chunk_size):
+            chunk = run[start:start + chunk_size]
+            pyramid.extend(np.column_stack([chunk[name] for name in channel_list]).tolist())
+        return pyramid.close()
+
+    with open(path, newline='') as file:
+        reader = csv.reader(file)
+        channel_list = next(reader)
+        if channel_list[-1] == 'Count':
+            channel_list = channel_list[:-1]
+        pyramid = LodPyramid(channel_list, path, factors, chunk_size)
+        for row in reader:
+            pyramid.append([float(value) for value in row[:len(channel_list)]])
+    return pyramid.close()
+
+
+#
+# run_length
+# @params: path - path of a .csv or .npy run
+#          chunk_size - number of bytes of a csv read at a time
+# @returns: number of samples in the run, without reading them
+def run_length(path, chunk_size=1 << 20):
+    if path.endswith('.npy'):
+        return len(load_run(path))
+    n_lines = 0
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(chunk_size), b''):
+            n_lines += chunk.count(b'\n')
+    # The header isn't a sample
+    return max(0, n_lines - 1)
+
+
+#
+# RunHistory
+# Reads the parts of a run needed to show a range of it
+class RunHistory:
+    #
+    # @params: path - path of a .csv or .npy run
+    #          factors - samples per bin of the tiers, built if they are missing or don't cover the run
+    def __init__(self, path, factors=LOD_FACTORS):
+        self.path = path
+        self.factors = tuple(factors)
+        self.n_samples = run_length(path)
+        if not self._tiers_match():
+            build_lod(path, self.factors)
+        self._tiers = {}
+        self._run = None
+
+        coarsest = self.tier(self.factors[-1])
+        self.channel_list = [name for name in coarsest.dtype.names if name != 'count']
+
+    #
+    # _tiers_match
+    # The tiers are missing or out of date if there aren't any or they don't cover every sample of the run, eg tiers
+    # cut off by a crash
+    # @params: none
+    # @returns: True if every tier exists and covers the run
+    def _tiers_match(self):
+        for factor in self.factors:
+            if not os.path.exists(lod_path(self.path, factor)):
+                return False
+            if int(np.load(lod_path(self.path, factor), mmap_mode='r')['count'].sum()) != self.n_samples:
+                return False
+        return True
+
+    #
+    # tier
+    # @params: factor - samples per bin
+    # @returns: memory-mapped array of the bins of the tier
+    def tier(self, factor):
+        if factor not in self._tiers:
+            self._tiers[factor] = np.load(lod_path(self.path, factor), mmap_mode='r')
+        return self._tiers[factor]
+
+    #
+    # window
+    # The samples start to stop, binned so there are at most max_points points
+    # @params: start, stop - range of samples, stop None for the end of the run
+    #          max_points - max number of points per channel
+    # @returns: dict of 'factor' (samples per point, 1 for every sample), 'x' (sample number of the first sample of
+    #           each point, counting from 1 like the Count column) and for each channel a (min, max, mean) tuple of
+    #           arrays
+    def window(self, start=0, stop=None, max_points=2000):
+        start = max(0, int(start))
+        stop = self.n_samples if stop is None else min(self.n_samples, int(stop))
+        stop = max(start, stop)
+        factor = self.factors[-1]
+        for candidate in (1,) + self.factors:
+            if (stop - start) / candidate <= max_points:
+                factor = candidate
+                break
+
+        result = {'factor': factor}
+        if factor == 1:
+            run = self._samples(start, stop)
+            result['x'] = np.arange(start, stop) + 1
+            for name in self.channel_list:
+                result[name] = (run[name], run[name], run[name])
+            return result
+
+        bins = self.tier(factor)[start // factor:-(-stop // factor)]
+        result['x'] = np.arange(start // factor, start // factor + len(bins)) * factor + 1
+        for name in self.channel_list:
+            result[name] = (bins[name]['min'], bins[name]['max'], bins[name]['mean'])
+        return result
+
+    def _samples(self, start, stop):
+        if self.path.endswith('.npy'):
+            if self._run is None:
+                self._run = load_run(self.path)
+            return self._run[start:stop]
+        # Only the rows asked for are read from a csv
+        columns = np.loadtxt(self.path, delimiter=',', skiprows=1 + start, max_rows=stop - start, dtype=np.float64,
+                             usecols=range(len(self.channel_list)), ndmin=2)
+        run = np.zeros(len(columns), dtype=loaded_dtype(self.channel_list))
+        for i in range(len(self.channel_list)):
+            run[self.channel_list[i]] = columns[:, i]
+        return run
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Plot a whole saved run')
+    parser.add_argument('run', help='.csv or .npy run')
+    parser.add_argument('--channels', nargs='+', help='channels to plot, all of them by default')
+    parser.add_argument('--max-points', type=int, default=2000, help='max points per channel on screen')
+    parser.add_argument('--build', action='store_true', help='only (re)build the level of detail tiers')
+    args = parser.parse_args(argv)
+
+    if args.build:
+        for path in build_lod(args.run):
+            print('Wrote', path)
+        return
+
+    import matplotlib.pyplot as plt
+    from .plotting import HistoryPlot
+
+    history = RunHistory(args.run)
+    HistoryPlot(history, args.channels, max_points=args.max_points)
+    plt.show()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+# Justin Smethers
+# Purdue Fort Wayne Physics
+# Advised by Dr. Mark Masters
+
+import warnings
+
+import numpy as np
+
+
+'''
+Parser for the counter lines sent by the PSoC.
+
+LineParser works on the raw bytes read from the serial port, a batch of lines at a time, without decoding each line
+to a str. A batch where every line has the same number of counters is converted to a 2d integer array by NumPy in
+one call. If that doesn't account for every value, the batch has a corrupt line in it, and the lines are checked one
+by one against a table of the bytes a counter line may contain. Corrupt lines are counted and skipped instead of
+ending the run.
+
+The same parser reads saved csv runs back, with dtype=np.float64 for runs that have float accidentals columns.
+
+Only the first n_channels counters of each line are kept. The PSoC prints every counter, and the ones that weren't
+configured with CTR/CHN are unused.
+'''
+
+# Bytes a counter line is made of. bytes.translate deleting these leaves nothing of a well formed line
+_COUNTER_BYTES = b'0123456789, \t\r\n'
+# Bytes a line of decimal values may also contain
+_DECIMAL_BYTES = _COUNTER_BYTES + b'.eE+-'
+
+
+#
+# LineParser
+# Turns batches of raw lines into fixed size records
+class LineParser:
+    #
+    # @params: n_channels - number of counters in use
+    #          dtype - np.int64 for counter lines, np.float64 to also read decimal values
+    def __init__(self, n_channels, dtype=np.int64):
+        self.n_channels = n_channels
+        self.dtype = np.dtype(dtype)
+        self._valid_bytes = _DECIMAL_BYTES if self.dtype.kind == 'f' else _COUNTER_BYTES
+        self._convert = float if self.dtype.kind == 'f' else int
+        self.lines_parsed = 0
+        self.malformed = 0
+
+    #
+    # parse_batch
+    # @params: lines - list of raw lines (bytes), blank lines are ignored
+    # @returns: array of dtype, of shape (n_good_lines, n_channels)
+    def parse_batch(self, lines):
+        lines = [line for line in lines if line.strip()]
+        values = self._parse_uniform(lines)
+        if values is not None:
+            return values
+
+        # At least one line is corrupt, find it
+        records = []
+        for line in lines:
+            record = self.parse(line)
+            if record is not None:
+                records.append(record)
+        return np.array(records, dtype=self.dtype).reshape(len(records), self.n_channels)
+
+    #
+    # parse_positions
+    # Like parse_batch, but keeps the place of every counter line, so the samples of several devices can be kept in
+    # step. A counter line is told apart by its shape, not its content: any line with at least n_channels - 1 commas
+    # (and at least one) holds a sample, and is returned as None if it's corrupt, even if its first bytes are garbage.
+    # Other lines, eg replies to commands, aren't samples and are skipped
+    # @params: lines - list of raw lines (bytes), blank lines are ignored
+    # @returns: list of records (lists of n_channels values) and None for each lost sample
+    def parse_positions(self, lines):
+        lines = [line for line in lines if line.strip()]
+        values = self._parse_uniform(lines)
+        if values is not None:
+            return values.tolist()
+
+        records = []
+        for line in lines:
+            record = self.parse(line)
+            if record is not None:
+                records.append(record)
+            elif line.count(b',') >= max(1, self.n_channels - 1):
+                records.append(None)
+        return records
+
+    #
+    # _parse_uniform
+    # Converts a batch where every line has the same number of counters in one NumPy call
+    # @params: lines - list of non-blank raw lines
+    # @returns: array of shape (len(lines), n_channels), None if a line is corrupt
+    def _parse_uniform(self, lines):
+        if not lines:
+            return np.zeros((0, self.n_channels), dtype=self.dtype)
+        n_fields = lines[0].count(b',') + 1
+        if n_fields < self.n_channels or any(line.count(b',') + 1 != n_fields for line in lines):
+            return None
+        # NumPy reads some values parse rejects, eg -3 in a counter line, so the bytes are checked the same way
+        if b''.join(lines).translate(None, self._valid_bytes):
+            return None
+        text = b' '.join(lines).replace(b',', b' ')
+        try:
+            with warnings.catch_warnings():
+                # Older NumPy versions warn and stop at a value they can't read, the size check below catches it
+                warnings.simplefilter('ignore', DeprecationWarning)
+                values = np.fromstring(text, dtype=self.dtype, sep=' ')
+        except ValueError:
+            return None
+        if values.size != len(lines) * n_fields:
+            return None
+        self.lines_parsed += len(lines)
+        return values.reshape(len(lines), n_fields)[:, :self.n_channels]
+
+    #
+    # parse
+    # @params: line - one raw line (bytes)
+    # @returns: list of n_channels ints (or floats), None if the line is corrupt
+    def parse(self, line):
+        fields = line.split(b',')
+        if len(fields) < self.n_channels or line.translate(None, self._valid_bytes):
+            self.malformed += 1
+            return None
+        try:
+            record = [self._convert(field) for field in fields[:self.n_channels]]
+        except ValueError:
+            # Empty field, eg '12,,4'
+            self.malformed += 1
+            return None
+        self.lines_parsed += 1
+        return record
+
+
+#
+# split_lines
+# Splits a chunk of serial data into complete lines
+# @params: data - bytes read from the serial port, including the incomplete line left over from the last chunk
+# @returns: lines - list of complete lines
+#           rest - bytes after the last line break, to be prepended to the next chunk
+def split_lines(data):
+    end = data.rfind(b'\n') + 1
+    return data[:end].splitlines(), data[end:]
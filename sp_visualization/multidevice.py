@@ -0,0 +1,202 @@
+# Justin Smethers
+# Purdue Fort Wayne Physics
+# Advised by Dr. Mark Masters
+
+import os
+import threading
+from collections import deque
+
+from .acquisition import Gap
+
+
+'''
+Support for running several PSoC units at once.
+
+Every device gets its own SerialReader thread and SampleRingBuffer, so the devices are read in parallel instead of
+one blocking read after another. MergedBuffer puts their samples on a common timeline: the n-th sample of every
+device makes up the n-th merged sample, which holds the counters of device 0 followed by those of device 1 and so
+on. It has the same interface as SampleRingBuffer, so the render loop doesn't need to know how many devices there
+are. The channels of each device are kept apart by prefixing them with the device name, eg 'ttyACM1: Channel A'.
+
+Pairing by position only holds if no device loses a sample without saying so. The readers and ring buffers of a
+MergedBuffer are run with mark_gaps, so a corrupt line or a sample dropped by a full ring buffer leaves a Gap in its
+place. The merged samples a device has a gap in are dropped and counted in gapped, and the devices stay in step.
+A device that stops streaming (unplugged, or its reader failed) is recorded as zeros from then on and listed in
+stopped, and a slow device can't make the others pile up: no device is held more than capacity samples ahead.
+'''
+
+# USB vendor id of Cypress, the maker of the PSoC
+PSOC_VENDOR_ID = 0x04B4
+
+
+#
+# discover_ports
+# Finds the serial ports PSoC units are connected to, by their USB vendor id, so other USB serial devices (eg an
+# Arduino) are left alone
+# @params: none
+# @returns: sorted list of port names, eg ['/dev/ttyACM0', '/dev/ttyACM1']
+def discover_ports():
+    from serial.tools import list_ports
+
+    ports = []
+    for port in list_ports.comports():
+        if port.vid == PSOC_VENDOR_ID:
+            ports.append(port.device)
+    return sorted(ports)
+
+
+#
+# open_ports
+# Opens a serial connection to each port
+# @params: ports - list of port names
+#          timeout - read timeout in seconds
+# @returns: list of open serial.Serial
+def open_ports(ports, timeout=1):
+    import serial
+
+    devices = []
+    for port in ports:
+        ser = serial.Serial()
+        ser.port = port
+        ser.timeout = timeout
+        ser.open()
+        devices.append(ser)
+    return devices
+
+
+#
+# device_names
+# Short names for the devices, used as channel namespaces
+# @params: devices - list of open serial connections
+# @returns: list of names, eg ['ttyACM0', 'ttyACM1']
+def device_names(devices):
+    names = [os.path.basename(str(getattr(ser, 'port', None) or '')) for ser in devices]
+    if len(set(names)) != len(names) or not all(names):
+        names = ['dev%d' % i for i in range(len(devices))]
+    return names
+
+
+#
+# namespaced
+# @params: device - device name
+#          name - channel name
+# @returns: channel name prefixed with the device name, eg 'ttyACM1: Channel A'
+def namespaced(device, name):
+    return device + ': ' + name
+
+
+#
+# MergedBuffer
+# Merges the ring buffers of several devices sample by sample
+class MergedBuffer:
+    #
+    # @params: buffers - SampleRingBuffer of each device, in device order
+    #          widths - number of counters read from each device
+    def __init__(self, buffers, widths):
+        self.buffers = buffers
+        self.widths = widths
+        self.capacity = min(buffer.capacity for buffer in buffers)
+        self.padded = 0           # samples completed with zeros because a device had stopped
+        self.gapped = 0           # samples dropped because a device lost its part of them
+        self.stopped = []         # indices of the devices that stopped while others were still streaming
+        self._overflow = 0        # samples dropped because another device fell more than capacity behind
+        self._pending = [deque() for buffer in buffers]
+        self._position = [0] * len(buffers)   # position in its stream of the first pending sample of each device
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return max(len(self.buffers[i]) + len(self._pending[i]) for i in range(len(self.buffers)))
+
+    @property
+    def overflow_count(self):
+        return sum(buffer.overflow_count for buffer in self.buffers) + self._overflow
+
+    @property
+    def high_watermark(self):
+        return max(buffer.high_watermark for buffer in self.buffers)
+
+    #
+    # drain
+    # Remove every sample all the devices have delivered, waiting up to timeout seconds for the slowest one. A device
+    # that has stopped is completed with zeros straight away, and no device is held more than capacity samples ahead
+    # of the others: its oldest samples are dropped, and counted in overflow_count, along with the same samples of
+    # the other devices when they arrive
+    # @params: timeout - seconds to wait if nothing can be merged, None waits forever
+    # @returns: list of merged samples in order
+    def drain(self, timeout=None):
+        with self._lock:
+            n_devices = len(self.buffers)
+            for i in range(n_devices):
+                # Only wait on a device that has nothing pending, the others are drained without waiting
+                wait = timeout if not self._pending[i] and not self.buffers[i].closed else 0
+                for sample in self.buffers[i].drain(wait):
+                    if isinstance(sample, Gap):
+                        self._pending[i].extend([None] * sample.count)
+                    else:
+                        self._pending[i].append(sample)
+                timeout = 0 if self._pending[i] else timeout
+
+            for i in range(n_devices):
+                excess = len(self._pending[i]) - self.capacity
+                if excess > 0:
+                    self._drop(i, excess)
+            self._align()
+
+            # A device is done once it has stopped and everything it sent has been merged
+            done = [self.buffers[i].closed and not self._pending[i] for i in range(n_devices)]
+            streaming = [i for i in range(n_devices) if not done[i]]
+            for i in range(n_devices):
+                if done[i] and streaming and i not in self.stopped:
+                    self.stopped.append(i)
+            if not streaming or any(self._position[i] != self._position[streaming[0]] for i in streaming):
+                return []
+            n_samples = min(len(self._pending[i]) for i in streaming)
+
+            samples = []
+            for n in range(n_samples):
+                sample = []
+                for i in range(n_devices):
+                    part = self._pending[i].popleft() if not done[i] else [0] * self.widths[i]
+                    if part is None or sample is None:
+                        sample = None
+                    else:
+                        sample.extend(part)
+                if sample is None:
+                    self.gapped += 1
+                else:
+                    samples.append(sample)
+            for i in streaming:
+                self._position[i] += n_samples
+            if len(streaming) < n_devices:
+                self.padded += n_samples
+            return samples
+
+    #
+    # _drop
+    # Drops the oldest pending samples of a device
+    # @params: device - index of the device
+    #          n - number of samples to drop
+    def _drop(self, device, n):
+        for k in range(n):
+            self._pending[device].popleft()
+        self._position[device] += n
+        self._overflow += n
+
+    #
+    # _align
+    # Drops the pending samples of each device that the devices ahead of it have already dropped
+    def _align(self):
+        target = max(self._position)
+        for i in range(len(self.buffers)):
+            behind = min(target - self._position[i], len(self._pending[i]))
+            if behind > 0:
+                for k in range(behind):
+                    self._pending[i].popleft()
+                self._position[i] += behind
+
+    #
+    # closed
+    # @returns: True once every device has stopped and every sample has been drained
+    @property
+    def closed(self):
+        return all(buffer.closed for buffer in self.buffers) and not any(self._pending)
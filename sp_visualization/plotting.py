@@ -0,0 +1,391 @@
+# Justin Smethers
+# Purdue Fort Wayne Physics
+# Advised by Dr. Mark Masters
+
+import os
+from collections import deque
+
+import matplotlib.pyplot as plt
+import matplotlib.gridspec as gridspec
+import numpy as np
+
+
+'''
+Live plotting engine used by the display process of a DisplaySink.
+
+LivePlotter keeps the last window_size points of every channel in preallocated NumPy buffers and draws them with
+matplotlib blitting: the axes, grid, ticks and legends are rendered once into a cached background, and each frame
+only the lines and captions are drawn on top of it. The background is only re-rendered when the axis limits have to
+move, which happens in steps rather than on every point. Adding a point is O(1) and nothing grows during a run.
+
+HistoryPlot shows a whole saved run from its level of detail tiers: the mean of each channel as a line, with its min
+to max range shaded. Zooming in loads a finer tier for the part of the run on screen.
+'''
+
+
+#
+# build_figure
+# builds the window and figure in which the data is plotted. Called by the display process of a DisplaySink
+# @params: none
+# @returns: fig - pyplot figure
+#           incident - subplot for detected single photons
+#           coincident - subplot for detected coincident photons
+#           legend - bottom panel, used for the pipeline status
+def build_figure():
+    # Turn on Pyplot interactive mode. Pyplot won't work within a thread without it
+    plt.ion()
+
+    # Create the figure window
+    fig = plt.figure(1)
+    fig.suptitle('Single photon detection', fontsize=24)
+    # Create a plot with 3 rows and 2 columns of subplots
+    gridspec.GridSpec(3, 2)
+
+    # Create plot for incident photon detections
+    incident = plt.subplot2grid((3, 2), (0, 0), colspan=1, rowspan=2)
+    incident.set_xlabel('Measurement number', fontsize=18)
+    incident.set_ylabel('Detected single photons', fontsize=18)
+    incident.tick_params(labelsize=16)
+    incident.set_xlim(0, 50)
+    incident.set_ylim(20, 80)
+    incident.grid()
+
+    # Create plot for coincidences and noise
+    coincident = plt.subplot2grid((3, 2), (0, 1), colspan=1, rowspan=2)
+    coincident.set_xlabel('Measurement number', fontsize=18)
+    coincident.set_ylabel('Detected coincident photons', fontsize=18)
+    coincident.tick_params(labelsize=16)
+    coincident.set_xlim(0, 50)
+    coincident.set_ylim(20, 80)
+    coincident.grid()
+
+    # Create a subplot to display the current number of counts on each plot
+    legend = plt.subplot2grid((3, 2), (2, 0), colspan=2, rowspan=1)
+    legend.tick_params(axis='both', which='both', bottom=False, left=False, labelbottom=False, labelleft=False)
+    legend.axis('off')
+
+    return fig, incident, coincident, legend
+
+
+#
+# RollingMax
+# Max of the last window_size values, tracked with a monotonic deque so each push is amortized O(1) instead of
+# rescanning the whole window
+class RollingMax:
+    #
+    # @params: window_size - number of most recent values the max is taken over
+    def __init__(self, window_size):
+        self.window_size = window_size
+        self._deque = deque()     # (index, value) pairs with decreasing values
+        self._index = 0
+
+    #
+    # push
+    # @params: value - newest value in the window
+    # @returns: none
+    def push(self, value):
+        while self._deque and self._deque[-1][1] <= value:
+            self._deque.pop()
+        self._deque.append((self._index, value))
+        if self._deque[0][0] <= self._index - self.window_size:
+            self._deque.popleft()
+        self._index += 1
+
+    #
+    # max
+    # @returns: max of the window, or 0 if nothing has been pushed yet
+    @property
+    def max(self):
+        return self._deque[0][1] if self._deque else 0
+
+
+#
+# LivePlotter
+# Draws the incident and coincident panels built by build_figure
+class LivePlotter:
+    color_list = ['r-', 'b-', 'g-', 'c-', 'y-', 'b-']
+    headroom = 1.25           # y-limits are set this much above the window max so they don't move on every point
+
+    #
+    # @params: fig, incident, coincident - figure and subplots returned by build_figure
+    #          individual_channel_list / coincident_channel_list - string names of the channels plotted on each panel,
+    #                                                              in the order their values are passed to append
+    #          window_size - max number of points per plot
+    #          blit - use blitting if the canvas supports it, otherwise redraw the whole figure every frame
+    #          status - optional axes (the legend panel from build_figure) set_status writes to
+    def __init__(self, fig, incident, coincident, individual_channel_list, coincident_channel_list, window_size=50,
+                 blit=True, status=None):
+        self.fig = fig
+        self.canvas = fig.canvas
+        self.window_size = window_size
+        self.blit = blit and getattr(fig.canvas, 'supports_blit', False)
+        self.scroll_step = max(1, window_size // 2)
+        self.axes = [incident, coincident]
+        self.legend_anchors = [(.4, -.175), (.45, -.185)]
+
+        # The captions and status line are created once and reused by every run
+        self.captions = []
+        for axes in self.axes:
+            self.captions.append(axes.text(0, -.65, '', transform=axes.transAxes, fontsize=15,
+                                           bbox={'facecolor': 'white'}, style='oblique', animated=self.blit))
+        self.status = None
+        if status is not None:
+            self.status = status.text(0.5, 0.05, '', transform=status.transAxes, fontsize=11, ha='center',
+                                      va='bottom', family='monospace', animated=self.blit)
+
+        self.annotations = {}     # extra caption text of each channel, eg its rate
+        self.lines = []
+        self._background = None
+        if self.blit:
+            self.canvas.mpl_connect('draw_event', self._on_draw)
+        self.reset(individual_channel_list, coincident_channel_list)
+
+    #
+    # reset
+    # Gets the plotter ready for a new run, possibly with different channels. The lines and legends of the last run
+    # are removed from the axes so nothing piles up between runs
+    # @params: individual_channel_list / coincident_channel_list - string names of the channels plotted on each panel,
+    #                                                              in the order their values are passed to append
+    # @returns: none
+    def reset(self, individual_channel_list, coincident_channel_list):
+        for line in self.lines:
+            line.remove()
+        for axes in self.axes:
+            if axes.get_legend() is not None:
+                axes.get_legend().remove()
+
+        # Each panel is (axes, channel names, y padding from the original y-limit calculation)
+        self.panels = [(self.axes[0], list(individual_channel_list), 3000),
+                       (self.axes[1], list(coincident_channel_list), 30)]
+        self.n_channels = len(individual_channel_list) + len(coincident_channel_list)
+
+        # Double length buffers: every point is written at pos and pos + window_size, so the last window_size points
+        # are always the contiguous slice [pos, pos + window_size) and no copy is needed to plot them
+        self._x = np.zeros(2 * self.window_size)
+        self._y = np.zeros((self.n_channels, 2 * self.window_size))
+        self._pos = 0
+        self._filled = 0
+        self.count = 0
+
+        self.lines = []
+        self.window_max = []
+        self._ylim = []
+        for i in range(len(self.panels)):
+            axes, names, pad = self.panels[i]
+            for j in range(len(names)):
+                color = self.color_list[j % len(self.color_list)]
+                if names[j].rpartition(': ')[2].startswith('Noise'):
+                    color = color.replace('-', '--')
+                line, = axes.plot([], [], color, label=names[j], lw=2, animated=self.blit)
+                self.lines.append(line)
+            if names:
+                axes.legend(loc=1, bbox_to_anchor=self.legend_anchors[i], fontsize=15)
+            self.captions[i].set_text('')
+            self.annotations = {}
+            self.window_max.append(RollingMax(self.window_size))
+            self._ylim.append(None)
+        self._xlim = None
+        self.set_status('')
+        self._needs_full_redraw = True
+
+    #
+    # append
+    # Add one measurement. O(1), nothing is drawn until render is called
+    # @params: values - sequence of n_channels counts in panel order
+    # @returns: none
+    def append(self, values):
+        self.count += 1
+        pos = self._pos
+        self._x[pos] = self._x[pos + self.window_size] = self.count
+        self._y[:, pos] = self._y[:, pos + self.window_size] = values
+        self._pos = (pos + 1) % self.window_size
+        if self._filled < self.window_size:
+            self._filled += 1
+
+        start = 0
+        for i in range(len(self.panels)):
+            end = start + len(self.panels[i][1])
+            if end > start:
+                self.window_max[i].push(max(values[start:end]))
+            start = end
+
+    #
+    # skip
+    # Counts measurements that weren't appended, eg because the display was behind, so the x axis stays in step
+    # @params: n - number of measurements skipped
+    # @returns: none
+    def skip(self, n):
+        self.count += n
+
+    #
+    # render
+    # Draw everything appended since the last call
+    # @params: none
+    # @returns: none
+    def render(self):
+        if self._filled == 0:
+            self.canvas.flush_events()
+            return
+
+        if self._filled < self.window_size:
+            window = slice(0, self._filled)
+        else:
+            window = slice(self._pos, self._pos + self.window_size)
+        x = self._x[window]
+        for i in range(self.n_channels):
+            self.lines[i].set_data(x, self._y[i, window])
+
+        self._update_limits()
+        self._update_captions()
+
+        if not self.blit:
+            self.canvas.draw()
+        elif self._needs_full_redraw or self._background is None:
+            # _on_draw caches the new background and draws the lines on top of it
+            self.canvas.draw()
+        else:
+            self.canvas.restore_region(self._background)
+            self._draw_animated()
+            self.canvas.blit(self.fig.bbox)
+        self._needs_full_redraw = False
+        self.canvas.flush_events()
+
+    #
+    # set_status
+    # Sets the text of the status line, it's drawn with the next render
+    # @params: text - status text
+    # @returns: none
+    def set_status(self, text):
+        if self.status is not None:
+            self.status.set_text(text)
+
+    #
+    # set_annotations
+    # Sets extra text shown after the latest value of each channel in the captions, drawn with the next render
+    # @params: annotations - dict of channel name to text
+    # @returns: none
+    def set_annotations(self, annotations):
+        self.annotations = annotations
+
+    #
+    # _update_limits
+    # Scrolls the x axis in steps of scroll_step and only moves the y-limits when the window max leaves the band
+    # they were set for, so the cached background stays valid for most frames
+    def _update_limits(self):
+        if self._xlim is None or self.count + 1 > self._xlim[1]:
+            right = max(self.count + self.scroll_step, self.window_size)
+            self._xlim = (right - self.window_size - self.scroll_step, right)
+            for axes, names, pad in self.panels:
+                axes.set_xlim(*self._xlim)
+            self._needs_full_redraw = True
+
+        for i in range(len(self.panels)):
+            axes, names, pad = self.panels[i]
+            if not names:
+                continue
+            top = self.window_max[i].max + pad
+            current = self._ylim[i]
+            if current is None or top > current or top * self.headroom < current / 2:
+                current = top * self.headroom
+                self._ylim[i] = current
+                axes.set_ylim(-(current * (1 / 60)), current)
+                self._needs_full_redraw = True
+
+    #
+    # _update_captions
+    # Reuses the caption artists, only their text changes
+    def _update_captions(self):
+        last = (self._pos - 1) % self.window_size
+        start = 0
+        for i in range(len(self.panels)):
+            names = self.panels[i][1]
+            lines = []
+            for j in range(len(names)):
+                value = self._y[start + j, last]
+                if names[j].rpartition(': ')[2].startswith('Noise'):
+                    line = names[j] + ': %.3g' % value
+                else:
+                    line = names[j] + ': ' + str(int(value))
+                if names[j] in self.annotations:
+                    line += '   ' + self.annotations[names[j]]
+                lines.append(line)
+            self.captions[i].set_text('\n'.join(lines))
+            start += len(names)
+
+    def _draw_animated(self):
+        for artist in self.lines + self.captions:
+            self.fig.draw_artist(artist)
+        if self.status is not None:
+            self.fig.draw_artist(self.status)
+
+    def _on_draw(self, event):
+        self._background = self.canvas.copy_from_bbox(self.fig.bbox)
+        self._draw_animated()
+
+
+#
+# HistoryPlot
+# Plots a whole run from a RunHistory, reloading the points on screen whenever the x axis is zoomed or panned
+class HistoryPlot:
+    #
+    # @params: history - RunHistory of the run
+    #          channel_list - names of the channels to plot, all of them by default
+    #          max_points - max points per channel on screen
+    def __init__(self, history, channel_list=None, max_points=2000):
+        self.history = history
+        self.channel_list = list(channel_list) if channel_list else list(history.channel_list)
+        self.max_points = max_points
+
+        self.fig, self.axes = plt.subplots()
+        self.fig.suptitle(os.path.basename(history.path), fontsize=20)
+        self.axes.set_xlabel('Measurement number', fontsize=16)
+        self.axes.set_ylabel('Counts', fontsize=16)
+        self.axes.grid()
+
+        self.lines = []
+        self.bands = [None] * len(self.channel_list)
+        for i in range(len(self.channel_list)):
+            color = LivePlotter.color_list[i % len(LivePlotter.color_list)]
+            if self.channel_list[i].rpartition(': ')[2].startswith('Noise'):
+                color = color.replace('-', '--')
+            line, = self.axes.plot([], [], color, label=self.channel_list[i], lw=1.5)
+            self.lines.append(line)
+        self.axes.legend(loc=1, fontsize=12)
+
+        self._window = None
+        self.update(0, history.n_samples)
+        self.axes.set_xlim(1, max(history.n_samples, 2))
+        self.axes.autoscale_view(scalex=False)
+        self.axes.callbacks.connect('xlim_changed', self._on_xlim)
+
+    #
+    # update
+    # Loads the points of the samples start to stop
+    # @params: start, stop - range of samples
+    # @returns: none
+    def update(self, start, stop):
+        window = self.history.window(start, stop, self.max_points)
+        self._window = (start, stop, window['factor'])
+        for i in range(len(self.channel_list)):
+            low, high, mean = window[self.channel_list[i]]
+            self.lines[i].set_data(window['x'], mean)
+            if self.bands[i] is not None:
+                self.bands[i].remove()
+            self.bands[i] = self.axes.fill_between(window['x'], low, high, color=self.lines[i].get_color(),
+                                                   alpha=.25, lw=0)
+        factor = window['factor']
+        self.axes.set_title('every sample' if factor == 1 else 'min/max/mean of every %d samples' % factor,
+                            fontsize=12)
+
+    def _on_xlim(self, axes):
+        left, right = axes.get_xlim()
+        # Load a little either side so a small pan doesn't need a reload
+        span = right - left
+        start, stop = int(max(0, left - 1 - span / 4)), int(right + span / 4) + 1
+        current = self._window
+        window = self.history.window(start, stop, self.max_points)
+        if current is not None and window['factor'] == current[2] and current[0] <= max(0, left - 1) and \
+                right <= current[1]:
+            return
+        self.update(start, stop)
+        self.fig.canvas.draw_idle()
@@ -0,0 +1,142 @@
+# Justin Smethers
+# Purdue Fort Wayne Physics
+# Advised by Dr. Mark Masters
+
+import asyncio
+import time
+
+
+'''
+Asyncio client for the PSoC command protocol.
+
+Reading a reply with readline until the port's 1 second timeout expires costs a full second per command. The
+CommandClient instead reads whatever is waiting on the port and stops as soon as the reply is complete: when a prompt
+is seen, if the PSoC prints one, otherwise once the lines the command is known to produce have arrived (the echo of
+every command while echo is on) and no more bytes have come for idle_timeout seconds. Commands that print slowly,
+like the SCN scan, are given a longer idle timeout (SLOW_COMMANDS), and a reply whose expected lines never come is
+given up on after reply_timeout seconds, the old readline timeout. Several commands are pipelined into one write and
+their replies read in one go, so a whole channel configuration (a CTR/CHN pair per counter) is applied in one
+exchange.
+
+The client only polls in_waiting and reads what is already there, so it never blocks the event loop and works with
+both serial.Serial and ReplaySerial, and the commands of several devices can be awaited together with
+asyncio.gather. run() calls a coroutine from ordinary code.
+'''
+
+# Seconds without a new byte after which a reply is taken to be complete
+DEFAULT_IDLE_TIMEOUT = 0.05
+# Max seconds to wait for the lines a reply is expected to have
+DEFAULT_REPLY_TIMEOUT = 1.0
+# Idle timeout of the commands that pause while printing their reply
+SLOW_COMMANDS = {'SCN': 1.0}
+
+
+#
+# run
+# Runs a coroutine of the client from code that isn't async, eg the REPL
+# @params: coroutine - eg client.command('HLP')
+# @returns: result of the coroutine
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+#
+# gather
+# @params: coroutines - list of coroutines, eg the same command on several devices
+# @returns: list of their results, in order
+async def gather(coroutines):
+    return list(await asyncio.gather(*coroutines))
+
+
+#
+# CommandClient
+# Sends commands to one PSoC and reads the replies
+class CommandClient:
+    #
+    # @params: ser - open serial.Serial or ReplaySerial
+    #          idle_timeout - seconds without a new byte after which a reply is complete
+    #          prompt - bytes the PSoC ends every reply with, None to rely on idle_timeout
+    #          poll_interval - seconds between checks of the port while waiting for a reply
+    #          reply_timeout - max seconds to wait for the lines a reply is expected to have
+    def __init__(self, ser, idle_timeout=DEFAULT_IDLE_TIMEOUT, prompt=None, poll_interval=0.002,
+                 reply_timeout=DEFAULT_REPLY_TIMEOUT):
+        self.ser = ser
+        self.idle_timeout = idle_timeout
+        self.prompt = prompt
+        self.poll_interval = poll_interval
+        self.reply_timeout = reply_timeout
+        self.echo = None          # whether the PSoC echoes commands, None until an ECO command has been sent
+
+    #
+    # command
+    # @params: entry - command, eg 'HLP' or 'WIN 5'
+    # @returns: list of the lines of the reply, without line endings
+    async def command(self, entry):
+        idle_timeout = max(self.idle_timeout, SLOW_COMMANDS.get(entry.strip()[:3].upper(), 0))
+        return await self.exchange([entry], idle_timeout)
+
+    #
+    # exchange
+    # Writes several commands at once and reads all of their replies. While echo is on the reply isn't complete
+    # before every command has been echoed
+    # @params: commands - list of commands
+    #          idle_timeout - seconds without a new byte after which the replies are complete, the client's by default
+    # @returns: list of the lines of the replies, without line endings
+    async def exchange(self, commands, idle_timeout=None):
+        self.ser.write(''.join(command + '\r\n' for command in commands).encode())
+        # A command is echoed if echo was on when it arrived, so ECO 0 is echoed and ECO 1 isn't
+        expected_lines = 0
+        for command in commands:
+            if self.echo:
+                expected_lines += 1
+            if command.strip()[:3].upper() == 'ECO':
+                self.echo = command.strip()[3:].strip() != '0'
+        return await self.read_reply(expected_lines, idle_timeout)
+
+    #
+    # configure_channels
+    # Assigns a CHN setting to each counter in one exchange
+    # @params: chn_list - CHN command of each counter in order, eg ['CHN1000', 'CHN0100', 'CHN1100']
+    # @returns: list of the lines of the replies
+    async def configure_channels(self, chn_list):
+        commands = []
+        for i in range(len(chn_list)):
+            commands.append('CTR' + str(i))
+            commands.append(chn_list[i])
+        return await self.exchange(commands)
+
+    #
+    # start_acquisition
+    # Turns echo off and sends the start command. The PSoC starts streaming counter lines straight after
+    # @params: none
+    # @returns: none
+    async def start_acquisition(self):
+        await self.command('ECO 0')
+        self.ser.write('STA\r\n'.encode())
+
+    #
+    # read_reply
+    # Reads until the prompt, or until the expected lines have arrived and the port has been quiet for idle_timeout
+    # seconds
+    # @params: expected_lines - number of lines the reply has at least, eg the echoes of the commands
+    #          idle_timeout - seconds without a new byte after which the reply is complete, the client's by default
+    # @returns: list of the lines read, without line endings
+    async def read_reply(self, expected_lines=0, idle_timeout=None):
+        if idle_timeout is None:
+            idle_timeout = self.idle_timeout
+        data = bytearray()
+        started = last_byte = time.perf_counter()
+        while True:
+            waiting = self.ser.in_waiting
+            if waiting:
+                data += self.ser.read(waiting)
+                last_byte = time.perf_counter()
+                if self.prompt is not None and data.rstrip().endswith(self.prompt):
+                    break
+                continue
+            now = time.perf_counter()
+            if now - last_byte >= idle_timeout:
+                if data.count(b'\n') >= expected_lines or now - started >= self.reply_timeout:
+                    break
+            await asyncio.sleep(self.poll_interval)
+        return [line for line in data.decode(errors='replace').splitlines() if line.strip()]
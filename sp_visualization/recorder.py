@@ -0,0 +1,621 @@
+# Justin Smethers
+# Purdue Fort Wayne Physics
+# Advised by Dr. Mark Masters
+
+import csv
+import glob
+import os
+import re
+import time
+
+import numpy as np
+
+
+'''
+Streaming run recorder.
+
+Every sample is written to disk as it arrives, already in column order (one column per channel plus a Count column),
+so nothing has to be held in memory for the whole run and no transpose pass is needed at the end. Each run gets its
+own timestamped file. While a run is in progress the file is named <run>.csv.partial and it is only renamed to
+<run>.csv once the run ends cleanly. recover_runs turns the .partial files left behind by a crash into normal runs.
+
+The accidentals ('Noise' channels) are computed, not counted, and are stored as floats: decimal values in the csv and
+8 byte float fields in the .npy, so a run keeps them at the precision they were computed with. Every other channel
+is an integer count.
+
+BinaryRunRecorder is a compact alternative to the csv: a standard .npy file holding one fixed-width record per sample
+with a field per channel, so the channel names travel in the file header. load_run memory-maps it, which opens a
+multi-million-sample run instantly, and convert_to_csv turns it back into the csv layout for other tools.
+
+Both recorders also keep a level of detail pyramid of the run: for every 10, 100 and 1000 samples (LOD_FACTORS) the
+min, max and mean of each channel, streamed to <run>_lod10.npy, <run>_lod100.npy and so on as the samples arrive.
+The run file itself is the finest tier. A plot of a whole run, however long, can then be drawn from a coarse tier
+with a bounded number of points, see history.py.
+'''
+
+PARTIAL_SUFFIX = '.partial'
+SAVE_FORMATS = ('csv', 'npy')
+
+# The .npy header is written with room for the largest possible row count, so the real count can be filled in
+# without moving the data that follows it
+_NPY_MAGIC = b'\x93NUMPY\x01\x00'
+_NPY_SHAPE_WIDTH = 20
+
+# Samples per bin of each level of detail tier
+LOD_FACTORS = (10, 100, 1000)
+# Name of a tier being written, eg run_20240131_142501_lod100.npy.partial
+_LOD_PARTIAL = re.compile(r'_lod(\d+)\.npy' + re.escape(PARTIAL_SUFFIX) + '$')
+
+
+#
+# run_file_name
+# Builds a timestamped file name for a new run, eg run_20240131_142501.csv
+# @params: directory - directory the run is saved in
+#          extension - file extension, including the dot
+# @returns: path to the new run file
+def run_file_name(directory='.', extension='.csv'):
+    name = 'run_' + time.strftime('%Y%m%d_%H%M%S')
+    path = os.path.join(directory, name + extension)
+    # Two runs started within the same second get a suffix instead of overwriting each other. The tiers and the
+    # telemetry log are named after the run without its extension, so the name is only free if no run of either
+    # format and none of those files use it
+    suffix = 1
+    while _name_taken(os.path.splitext(path)[0]):
+        path = os.path.join(directory, '%s_%d%s' % (name, suffix, extension))
+        suffix += 1
+    return path
+
+
+# Files named after a run, given its path without the extension: the run itself (.csv, .npy, finished or .partial),
+# its level of detail tiers and its telemetry log
+_RUN_FILE_PATTERNS = ('.*', '_lod*.npy*', '_telemetry.jsonl*')
+
+
+def _name_taken(stem):
+    return any(glob.glob(glob.escape(stem) + pattern) for pattern in _RUN_FILE_PATTERNS)
+
+
+#
+# RunRecorder
+# Writes the samples of one run to a csv file in chunks
+class RunRecorder:
+    #
+    # @params: channel_list - list of string names of channels recorded, in the order values are passed to append
+    #          directory - directory the run is saved in
+    #          chunk_size - number of rows buffered before they are written to the file
+    #          flush_interval - max number of seconds between flushes to disk
+    #          lod_factors - samples per bin of each level of detail tier, empty to not keep the tiers
+    def __init__(self, channel_list, directory='.', chunk_size=1000, flush_interval=1.0, lod_factors=LOD_FACTORS):
+        self.channel_list = list(channel_list)
+        self._noise = [is_noise_channel(name) for name in self.channel_list]
+        self.path = run_file_name(directory)
+        self.chunk_size = chunk_size
+        self.flush_interval = flush_interval
+        self.count = 0
+        self._rows = []
+        self._last_flush = time.time()
+
+        os.makedirs(directory, exist_ok=True)
+        self._file = open(self.path + PARTIAL_SUFFIX, 'w', newline='')
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(self.channel_list + ['Count'])
+        self.pyramid = LodPyramid(self.channel_list, self.path, lod_factors) if lod_factors else None
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    #
+    # append
+    # Add one sample to the run
+    # @params: values - sequence of values, one per channel
+    # @returns: none
+    def append(self, values):
+        self.count += 1
+        row = ['%.6g' % values[i] if self._noise[i] else int(values[i]) for i in range(len(self.channel_list))]
+        row.append(self.count)
+        self._rows.append(row)
+        if self.pyramid is not None:
+            self.pyramid.append(values)
+        if len(self._rows) >= self.chunk_size or time.time() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    #
+    # extend
+    # Add a batch of samples to the run
+    # @params: rows - 2d array, a row of values per sample
+    # @returns: none
+    def extend(self, rows):
+        rows = np.asarray(rows)
+        columns = []
+        for i in range(len(self.channel_list)):
+            if self._noise[i]:
+                columns.append(['%.6g' % value for value in rows[:, i].tolist()])
+            else:
+                columns.append(rows[:, i].astype(np.int64).tolist())
+        columns.append(range(self.count + 1, self.count + len(rows) + 1))
+        self._rows.extend(zip(*columns))
+        self.count += len(rows)
+        if self.pyramid is not None:
+            self.pyramid.extend(rows)
+        if len(self._rows) >= self.chunk_size or time.time() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    #
+    # flush
+    # Write the buffered rows and push them to disk, so at most flush_interval seconds of data are lost on a crash
+    # @params: none
+    # @returns: none
+    def flush(self):
+        if self._rows:
+            self._writer.writerows(self._rows)
+            self._rows = []
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        if self.pyramid is not None:
+            self.pyramid.flush()
+        self._last_flush = time.time()
+
+    #
+    # close
+    # Finish the run and give the file its final name
+    # @params: none
+    # @returns: path of the saved run
+    def close(self):
+        if self._file.closed:
+            return self.path
+        self.flush()
+        if self.pyramid is not None:
+            self.pyramid.close()
+        self._file.close()
+        os.replace(self.path + PARTIAL_SUFFIX, self.path)
+        return self.path
+
+
+#
+# recover_runs
+# Finalizes the runs an interrupted session left as .partial files. A half written last row is cut off. The level of
+# detail tiers of a run lag behind it by the samples that weren't binned yet, so they are built again from the
+# recovered run instead of being kept
+# @params: directory - directory the runs are saved in
+# @returns: list of paths of the recovered runs
+def recover_runs(directory='.'):
+    # Imported here, history imports this module
+    from .history import build_lod
+
+    partials = sorted(glob.glob(os.path.join(directory, '*' + PARTIAL_SUFFIX)))
+    tier_factors = {}
+    for partial in partials:
+        match = _LOD_PARTIAL.search(partial)
+        if match:
+            tier_factors.setdefault(partial[:match.start()], []).append(int(match.group(1)))
+            os.remove(partial)
+
+    recovered = []
+    for partial in partials:
+        if _LOD_PARTIAL.search(partial):
+            continue
+        path = partial[:-len(PARTIAL_SUFFIX)]
+        if path.endswith('.npy'):
+            _recover_npy(partial)
+        else:
+            with open(partial, 'rb+') as file:
+                data = file.read()
+                end = data.rfind(b'\n') + 1
+                if end != len(data):
+                    file.truncate(end)
+        os.replace(partial, path)
+        factors = tier_factors.get(os.path.splitext(path)[0])
+        if factors:
+            build_lod(path, sorted(factors))
+        recovered.append(path)
+    return recovered
+
+
+#
+# is_noise_channel
+# @params: name - channel name, eg 'Noise AB' or 'ttyACM1: Noise AB'
+# @returns: True for an accidentals channel, which holds floats instead of counts
+def is_noise_channel(name):
+    return name.rpartition(': ')[2].startswith('Noise')
+
+
+#
+# run_dtype
+# Record layout of a binary run: one fixed-width unsigned integer field per counted channel, a float field per
+# accidentals channel
+# @params: channel_list - list of string names of channels
+#          width - bytes per count
+# @returns: numpy structured dtype
+def run_dtype(channel_list, width=4):
+    return np.dtype([(name, '<f8' if is_noise_channel(name) else '<u%d' % width) for name in channel_list])
+
+
+#
+# loaded_dtype
+# Layout a run is loaded into from a csv: int64 counts and float accidentals
+# @params: channel_list - list of string names of channels
+# @returns: numpy structured dtype
+def loaded_dtype(channel_list):
+    return np.dtype([(name, np.float64 if is_noise_channel(name) else np.int64) for name in channel_list])
+
+
+#
+# _npy_header
+# Builds a version 1.0 .npy header for a 1-d array of records. The header length doesn't depend on n_rows
+# @params: dtype - record dtype
+#          n_rows - number of records in the file
+# @returns: header bytes
+def _npy_header(dtype, n_rows):
+    header = "{'descr': %r, 'fortran_order': False, 'shape': (%s,), }" % (
+        np.lib.format.dtype_to_descr(dtype), str(n_rows).rjust(_NPY_SHAPE_WIDTH))
+    # Pad so the data starts on a 64 byte boundary, as numpy does
+    length = len(_NPY_MAGIC) + 2 + len(header) + 1
+    header += ' ' * (-length % 64) + '\n'
+    return _NPY_MAGIC + len(header).to_bytes(2, 'little') + header.encode('latin1')
+
+
+#
+# RecordWriter
+# Streams records of a fixed dtype to a .npy file, under a .partial name until it's closed
+class RecordWriter:
+    #
+    # @params: path - final path of the .npy file
+    #          dtype - record dtype
+    #          chunk_size - number of records buffered before they are written to the file
+    def __init__(self, path, dtype, chunk_size=4096):
+        self.path = path
+        self.dtype = dtype
+        self.count = 0
+        self._chunk = np.zeros(chunk_size, dtype=dtype)
+        self._filled = 0
+
+        self._file = open(self.path + PARTIAL_SUFFIX, 'wb')
+        self._file.write(_npy_header(self.dtype, 0))
+
+    #
+    # append
+    # @params: record - tuple of field values
+    # @returns: none
+    def append(self, record):
+        self._chunk[self._filled] = record
+        self._filled += 1
+        self.count += 1
+        if self._filled == len(self._chunk):
+            self.write_buffered()
+
+    #
+    # extend
+    # @params: records - array of records
+    # @returns: none
+    def extend(self, records):
+        self.write_buffered()
+        self._file.write(np.ascontiguousarray(records, dtype=self.dtype).tobytes())
+        self.count += len(records)
+
+    #
+    # write_buffered
+    # Writes the buffered records to the file, without syncing it to disk
+    # @params: none
+    # @returns: none
+    def write_buffered(self):
+        if self._filled:
+            self._file.write(self._chunk[:self._filled].tobytes())
+            self._filled = 0
+
+    #
+    # flush
+    # Write the buffered records and push them to disk. The header's row count is only fixed up on close, a crashed
+    # file gets it from recover_runs
+    # @params: none
+    # @returns: none
+    def flush(self):
+        self.write_buffered()
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    #
+    # close
+    # Writes the final row count into the header and gives the file its final name
+    # @params: none
+    # @returns: path of the file
+    def close(self):
+        if self._file.closed:
+            return self.path
+        self.flush()
+        self._file.seek(0)
+        self._file.write(_npy_header(self.dtype, self.count))
+        self._file.close()
+        os.replace(self.path + PARTIAL_SUFFIX, self.path)
+        return self.path
+
+
+#
+# lod_dtype
+# Record layout of a level of detail tier: the number of samples in the bin, then the min, max and mean of each channel.
+# The min and max of the accidentals are floats like the accidentals themselves
+# @params: channel_list - list of string names of channels
+# @returns: numpy structured dtype
+def lod_dtype(channel_list):
+    counts = np.dtype([('min', '<i8'), ('max', '<i8'), ('mean', '<f8')])
+    noise = np.dtype([('min', '<f8'), ('max', '<f8'), ('mean', '<f8')])
+    return np.dtype([('count', '<u4')] + [(name, noise if is_noise_channel(name) else counts)
+                                          for name in channel_list])
+
+
+#
+# lod_path
+# @params: path - path of a run
+#          factor - samples per bin of the tier
+# @returns: path of the tier, eg run_20240131_142501_lod100.npy
+def lod_path(path, factor):
+    return '%s_lod%d.npy' % (os.path.splitext(path)[0], factor)
+
+
+#
+# LodPyramid
+# Builds the level of detail tiers of a run as its samples arrive. Each tier is made from the bins of the one below,
+# so every sample is only looked at once
+class LodPyramid:
+    #
+    # @params: channel_list - list of string names of channels, in the order values are passed to append
+    #          path - path of the run the tiers belong to
+    #          factors - samples per bin of each tier, each a multiple of the one before
+    #          chunk_size - number of samples binned at a time
+    def __init__(self, channel_list, path, factors=LOD_FACTORS, chunk_size=1000):
+        self.channel_list = list(channel_list)
+        self.factors = tuple(factors)
+        self.chunk_size = chunk_size
+        self.dtype = lod_dtype(self.channel_list)
+        self.writers = [RecordWriter(lod_path(path, factor), self.dtype, chunk_size=1) for factor in self.factors]
+        self._ratios = [self.factors[0]] + [self.factors[i] // self.factors[i - 1] for i in range(1, len(self.factors))]
+        self._rows = []           # samples appended one at a time since the last array of samples
+        self._arrays = []         # arrays of samples not binned yet
+        self._n_waiting = 0
+        # Bins of the tier below each tier that don't fill a bin of it yet, as (count, min, max, sum) arrays
+        self._pending = [None] * len(self.factors)
+
+    #
+    # append
+    # @params: values - sequence of counts, one per channel
+    # @returns: none
+    def append(self, values):
+        self._rows.append(values)
+        self._n_waiting += 1
+        if self._n_waiting >= self.chunk_size:
+            self._bin(final=False)
+
+    #
+    # extend
+    # @params: rows - 2d array of samples, a row per sample
+    # @returns: none
+    def extend(self, rows):
+        self._take_rows()
+        self._arrays.append(np.asarray(rows, dtype=np.float64).reshape(len(rows), len(self.channel_list)))
+        self._n_waiting += len(rows)
+        if self._n_waiting >= self.chunk_size:
+            self._bin(final=False)
+
+    #
+    # flush
+    # @params: none
+    # @returns: none
+    def flush(self):
+        for writer in self.writers:
+            writer.flush()
+
+    #
+    # close
+    # Bins what's left, including the last bins of each tier that aren't full
+    # @params: none
+    # @returns: list of paths of the tiers
+    def close(self):
+        self._bin(final=True)
+        return [writer.close() for writer in self.writers]
+
+    def _take_rows(self):
+        if self._rows:
+            self._arrays.append(np.array(self._rows, dtype=np.float64).reshape(len(self._rows),
+                                                                                 len(self.channel_list)))
+            self._rows = []
+
+    def _bin(self, final):
+        self._take_rows()
+        # Counts are exact in float64, so every channel is binned as floats
+        rows = np.concatenate(self._arrays) if self._arrays else np.zeros((0, len(self.channel_list)))
+        self._arrays = []
+        self._n_waiting = 0
+        bins = (np.ones(len(rows), dtype=np.int64), rows, rows, rows)
+        for i in range(len(self.factors)):
+            if self._pending[i] is not None:
+                bins = tuple(np.concatenate([self._pending[i][j], bins[j]]) for j in range(4))
+            ratio = self._ratios[i]
+            n_bins = -(-len(bins[0]) // ratio) if final else len(bins[0]) // ratio
+            end = min(n_bins * ratio, len(bins[0]))
+            self._pending[i] = tuple(column[end:] for column in bins) if end < len(bins[0]) else None
+            if n_bins == 0:
+                if not final:
+                    return
+                # Nothing new for this tier, but the tiers above still have their last bins to write
+                bins = tuple(column[:0] for column in bins)
+                continue
+            starts = np.arange(0, end, ratio)
+            bins = (np.add.reduceat(bins[0][:end], starts), np.minimum.reduceat(bins[1][:end], starts),
+                    np.maximum.reduceat(bins[2][:end], starts), np.add.reduceat(bins[3][:end], starts))
+
+            records = np.zeros(n_bins, dtype=self.dtype)
+            records['count'] = bins[0]
+            for j in range(len(self.channel_list)):
+                records[self.channel_list[j]]['min'] = bins[1][:, j]
+                records[self.channel_list[j]]['max'] = bins[2][:, j]
+                records[self.channel_list[j]]['mean'] = bins[3][:, j] / bins[0]
+            self.writers[i].extend(records)
+
+
+#
+# BinaryRunRecorder
+# Writes the samples of one run to a .npy file of fixed-width records. Same interface as RunRecorder
+class BinaryRunRecorder:
+    #
+    # @params: channel_list - list of string names of channels recorded, in the order values are passed to append
+    #          directory - directory the run is saved in
+    #          chunk_size - number of records buffered before they are written to the file
+    #          flush_interval - max number of seconds between flushes to disk
+    #          width - bytes per count
+    #          lod_factors - samples per bin of each level of detail tier, empty to not keep the tiers
+    def __init__(self, channel_list, directory='.', chunk_size=4096, flush_interval=1.0, width=4,
+                 lod_factors=LOD_FACTORS):
+        self.channel_list = list(channel_list)
+        self.dtype = run_dtype(self.channel_list, width)
+        self.path = run_file_name(directory, '.npy')
+        self.flush_interval = flush_interval
+        self._last_flush = time.time()
+
+        os.makedirs(directory, exist_ok=True)
+        self._writer = RecordWriter(self.path, self.dtype, chunk_size)
+        self.pyramid = LodPyramid(self.channel_list, self.path, lod_factors) if lod_factors else None
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    #
+    # count
+    # @returns: number of samples recorded
+    @property
+    def count(self):
+        return self._writer.count
+
+    #
+    # append
+    # Add one sample to the run
+    # @params: values - sequence of counts, one per channel
+    # @returns: none
+    def append(self, values):
+        self._writer.append(tuple(values))
+        if self.pyramid is not None:
+            self.pyramid.append(values)
+        if time.time() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    #
+    # extend
+    # Add a batch of samples to the run
+    # @params: rows - 2d array, a row of values per sample
+    # @returns: none
+    def extend(self, rows):
+        rows = np.asarray(rows)
+        records = np.zeros(len(rows), dtype=self.dtype)
+        for i in range(len(self.channel_list)):
+            records[self.channel_list[i]] = rows[:, i]
+        self._writer.extend(records)
+        if self.pyramid is not None:
+            self.pyramid.extend(rows)
+        if time.time() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    #
+    # flush
+    # Write the buffered records and push them to disk. The header's row count is only fixed up on close, a crashed
+    # run gets it from recover_runs
+    # @params: none
+    # @returns: none
+    def flush(self):
+        self._writer.flush()
+        if self.pyramid is not None:
+            self.pyramid.flush()
+        self._last_flush = time.time()
+
+    #
+    # close
+    # Finish the run, write the final row count into the header and give the file its final name
+    # @params: none
+    # @returns: path of the saved run
+    def close(self):
+        if self.pyramid is not None:
+            self.pyramid.close()
+        return self._writer.close()
+
+
+#
+# open_recorder
+# Creates the recorder for a run in the chosen format
+# @params: channel_list - list of string names of channels recorded
+#          directory - directory the run is saved in
+#          save_format - 'csv' or 'npy'
+#          lod_factors - samples per bin of each level of detail tier, empty to not keep the tiers
+# @returns: RunRecorder or BinaryRunRecorder
+def open_recorder(channel_list, directory='.', save_format='csv', lod_factors=LOD_FACTORS):
+    if save_format == 'csv':
+        return RunRecorder(channel_list, directory, lod_factors=lod_factors)
+    if save_format == 'npy':
+        return BinaryRunRecorder(channel_list, directory, lod_factors=lod_factors)
+    raise ValueError('Unknown save format %r, expected one of %s' % (save_format, ', '.join(SAVE_FORMATS)))
+
+
+#
+# _recover_npy
+# Cuts a crashed binary run down to whole records and writes the real row count into its header
+# @params: partial - path of the .npy.partial file
+# @returns: none
+def _recover_npy(partial):
+    with open(partial, 'rb+') as file:
+        np.lib.format.read_magic(file)
+        shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(file)
+        offset = file.tell()
+        file.seek(0, os.SEEK_END)
+        n_rows = (file.tell() - offset) // dtype.itemsize
+        file.truncate(offset + n_rows * dtype.itemsize)
+        file.seek(0)
+        file.write(_npy_header(dtype, n_rows))
+
+
+#
+# load_run
+# Opens a saved run. Binary runs are memory-mapped, so only the parts that are used are read from disk
+# @params: path - path of a .npy or .csv run
+# @returns: structured numpy array with a field per channel (the Count column of csv runs is dropped), int64 counts
+#           and float accidentals for a csv
+def load_run(path):
+    if path.endswith('.npy'):
+        return np.load(path, mmap_mode='r')
+
+    with open(path, newline='') as file:
+        channel_list = next(csv.reader(file))
+    if channel_list[-1] == 'Count':
+        channel_list = channel_list[:-1]
+    columns = np.loadtxt(path, delimiter=',', skiprows=1, dtype=np.float64, usecols=range(len(channel_list)),
+                         ndmin=2)
+    run = np.zeros(len(columns), dtype=loaded_dtype(channel_list))
+    for i in range(len(channel_list)):
+        run[channel_list[i]] = columns[:, i]
+    return run
+
+
+#
+# convert_to_csv
+# Converts a binary run to the csv layout written by RunRecorder
+# @params: path - path of the .npy run
+#          csv_path - path of the csv to write, defaults to the same name with a .csv extension
+#          chunk_size - number of records converted at a time
+# @returns: path of the csv
+def convert_to_csv(path, csv_path=None, chunk_size=65536):
+    if csv_path is None:
+        csv_path = os.path.splitext(path)[0] + '.csv'
+    run = load_run(path)
+    channel_list = list(run.dtype.names)
+    with open(csv_path, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(channel_list + ['Count'])
+        for start in range(0, len(run), chunk_size):
+            chunk = run[start:start + chunk_size]
+            columns = [chunk[name].tolist() for name in channel_list]
+            columns.append(range(start + 1, start + len(chunk) + 1))
+            writer.writerows(zip(*columns))
+    return csv_path
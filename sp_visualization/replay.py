@@ -0,0 +1,285 @@
+# Justin Smethers
+# Purdue Fort Wayne Physics
+# Advised by Dr. Mark Masters
+
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+from .accidentals import DEFAULT_GATE_TIME, DEFAULT_WINDOW
+from .recorder import load_run
+
+
+'''
+Offline stand-in for the PSoC.
+
+ReplaySerial has the parts of the serial.Serial interface the script uses (open, close, write, read, readline,
+in_waiting, timeout) and answers the PSoC's ECO/CHN/CTR/STA/STP protocol, so the plotting, parsing and saving paths
+can be run and profiled without the hardware. After STA it streams counter lines from a sample source at a chosen
+line rate, or as fast as possible. Two sources are available: RunFileSource replays a saved run and PoissonSource
+simulates detectors with Poisson distributed counts and a correlated photon pair rate.
+
+Unlike the real device, read and readline return b'' straight away when there's nothing to send instead of waiting
+out the timeout, so command exchanges don't cost a second each.
+'''
+
+LETTERS = 'ABCD'
+N_COUNTERS = 16
+
+HELP_TEXT = [
+    'Replay PSoC commands:',
+    'ECO 0/1  - echo off/on',
+    'CTRn     - select counter n',
+    'CHNabcd  - count the detectors set to 1 on the selected counter, eg CHN1100 for AB',
+    'STA      - start counting',
+    'STP      - stop counting',
+    'WIN n    - coincidence window in ns',
+]
+
+
+#
+# chn_letters
+# @params: bits - CHN argument, eg '1100'
+# @returns: letters of the detectors counted, eg 'AB'
+def chn_letters(bits):
+    return ''.join(LETTERS[i] for i in range(min(len(bits), len(LETTERS))) if bits[i] == '1')
+
+
+#
+# letters_chn
+# @params: letters - letters of the detectors counted, eg 'AB'
+# @returns: CHN argument, eg '1100'
+def letters_chn(letters):
+    return ''.join('1' if letter in letters else '0' for letter in LETTERS)
+
+
+#
+# RunFileSource
+# Replays the counts of a saved run. Counters set to a combination that wasn't recorded read 0
+class RunFileSource:
+    #
+    # @params: path - path of a .csv or .npy run
+    #          loop - start over at the end of the run instead of stopping
+    def __init__(self, path, loop=False):
+        self.run = load_run(path)
+        self.loop = loop
+
+    #
+    # rows
+    # @params: letters_list - letters counted by each counter, None for unused counters
+    # @returns: generator of tuples of counts, one per counter
+    def rows(self, letters_list):
+        columns = []
+        for letters in letters_list:
+            name = 'Channel ' + letters if letters else None
+            columns.append(np.asarray(self.run[name], dtype=np.int64) if name in self.run.dtype.names
+                           else np.zeros(len(self.run), dtype=np.int64))
+        table = np.column_stack(columns) if columns else np.zeros((len(self.run), 0), dtype=np.int64)
+        while True:
+            for row in table.tolist():
+                yield row
+            if not self.loop or len(table) == 0:
+                return
+
+
+#
+# PoissonSource
+# Simulated detectors. Each detector sees uncorrelated photons at its own rate, the detectors in correlated also see
+# photon pairs (or triples, ...) at pair_rate, and every coincidence counter picks up the accidentals of its detectors
+class PoissonSource:
+    #
+    # @params: rates - mean uncorrelated counts per gate of each detector, eg {'A': 50000, 'B': 40000}
+    #          pair_rate - mean correlated counts per gate seen by all detectors in correlated
+    #          correlated - letters of the detectors the correlated photons reach
+    #          window - coincidence window in seconds
+    #          gate_time - seconds of counting per sample
+    #          n_samples - number of samples to produce, None for no limit
+    #          seed - random seed
+    #          batch_size - number of samples drawn per NumPy call
+    def __init__(self, rates=None, pair_rate=2000, correlated='AB', window=DEFAULT_WINDOW,
+                 gate_time=DEFAULT_GATE_TIME, n_samples=None, seed=None, batch_size=1024):
+        self.rates = rates if rates is not None else {'A': 50000, 'B': 50000, 'C': 50000, 'D': 50000}
+        self.pair_rate = pair_rate
+        self.correlated = correlated
+        self.window = window
+        self.gate_time = gate_time
+        self.n_samples = n_samples
+        self.batch_size = batch_size
+        self._rng = np.random.default_rng(seed)
+
+    #
+    # rows
+    # @params: letters_list - letters counted by each counter, None for unused counters
+    # @returns: generator of tuples of counts, one per counter
+    def rows(self, letters_list):
+        produced = 0
+        mean = np.array([self.rates.get(letter, 0) for letter in LETTERS], dtype=np.float64)
+        in_pair = np.array([letter in self.correlated for letter in LETTERS])
+        while self.n_samples is None or produced < self.n_samples:
+            size = self.batch_size
+            if self.n_samples is not None:
+                size = min(size, self.n_samples - produced)
+            pairs = self._rng.poisson(self.pair_rate, size)
+            singles = self._rng.poisson(mean, (size, len(LETTERS))) + pairs[:, np.newaxis] * in_pair
+
+            columns = []
+            for letters in letters_list:
+                if not letters:
+                    columns.append(np.zeros(size, dtype=np.int64))
+                    continue
+                members = [LETTERS.index(letter) for letter in letters]
+                if len(members) == 1:
+                    columns.append(singles[:, members[0]])
+                    continue
+                fold = len(members)
+                accidental = fold * (self.window / self.gate_time) ** (fold - 1) * singles[:, members].prod(axis=1)
+                true = pairs if all(letter in self.correlated for letter in letters) else 0
+                columns.append(true + self._rng.poisson(accidental))
+            for row in np.column_stack(columns).tolist():
+                yield row
+            produced += size
+
+
+#
+# ReplaySerial
+# Stands in for serial.Serial
+class ReplaySerial:
+    max_lines = 256           # most counter lines generated at a time
+    #
+    # @params: source - RunFileSource or PoissonSource
+    #          line_rate - counter lines sent per second after STA, None sends them as fast as they are read
+    #          n_counters - number of counters on each line
+    def __init__(self, source, line_rate=None, n_counters=N_COUNTERS):
+        self.source = source
+        self.line_rate = line_rate
+        self.n_counters = n_counters
+        self.port = 'replay'
+        self.timeout = 1
+        self.is_open = False
+        # A simulated source starts out at its own window, and follows the one set with WIN from then on
+        self.window = getattr(source, 'window', DEFAULT_WINDOW)
+
+        self._lock = threading.Lock()
+        self._replies = deque()
+        self._echo = True
+        self._counter = 0
+        self._letters = [None] * n_counters
+        self._rows = None
+        self._next_line = 0
+        self._pending = bytearray()
+
+    def open(self):
+        self.is_open = True
+
+    def close(self):
+        self.is_open = False
+
+    #
+    # write
+    # Executes the commands in data
+    # @params: data - bytes of one or more \r\n terminated commands
+    # @returns: number of bytes written
+    def write(self, data):
+        with self._lock:
+            for command in data.decode().replace('\r', '\n').split('\n'):
+                if command.strip():
+                    self._execute(command.strip())
+        return len(data)
+
+    #
+    # in_waiting
+    # @returns: number of bytes that can be read without waiting
+    @property
+    def in_waiting(self):
+        self._fill(block=False)
+        return len(self._pending)
+
+    #
+    # read
+    # @params: size - max number of bytes to read
+    # @returns: up to size bytes, b'' if there is nothing to send
+    def read(self, size=1):
+        if not self._pending:
+            self._fill(block=True)
+        data = bytes(self._pending[:size])
+        del self._pending[:size]
+        return data
+
+    #
+    # readline
+    # @params: none
+    # @returns: next reply or counter line as bytes, b'' if there is nothing to send
+    def readline(self):
+        if not self._pending:
+            self._fill(block=True)
+        end = self._pending.find(b'\n') + 1 or len(self._pending)
+        line = bytes(self._pending[:end])
+        del self._pending[:end]
+        return line
+
+    #
+    # _fill
+    # Moves the replies and the counter lines that are due into the pending bytes
+    # @params: block - wait for the next counter line if none is due yet
+    # @returns: none
+    def _fill(self, block):
+        with self._lock:
+            while self._replies:
+                self._pending += self._replies.popleft()
+            rows = self._rows
+        if self._pending or rows is None:
+            return
+
+        if self.line_rate:
+            wait = self._next_line - time.perf_counter()
+            if wait > 0:
+                if not block:
+                    return
+                time.sleep(wait)
+            # Lines the reader didn't pick up in time pile up like they would in the port's buffer
+            n_lines = min(self.max_lines, int((time.perf_counter() - self._next_line) * self.line_rate) + 1)
+            self._next_line += n_lines / self.line_rate
+        else:
+            n_lines = self.max_lines
+
+        for i in range(n_lines):
+            row = next(rows, None)
+            if row is None:
+                # The source ran out, behave as if STP had been sent
+                with self._lock:
+                    self._rows = None
+                break
+            self._pending += (', '.join(map(str, row)) + '\r\n').encode()
+
+    def _reply(self, line):
+        self._replies.append((line + '\r\n').encode())
+
+    def _execute(self, command):
+        if self._echo:
+            self._reply(command)
+        name = command[:3].upper()
+        argument = command[3:].strip()
+        if name == 'ECO':
+            self._echo = argument != '0'
+        elif name == 'CTR':
+            self._counter = int(argument)
+        elif name == 'CHN':
+            self._letters[self._counter] = chn_letters(argument) or None
+        elif name == 'STA':
+            if hasattr(self.source, 'window'):
+                self.source.window = self.window
+            self._rows = self.source.rows(self._letters)
+            self._next_line = time.perf_counter()
+        elif name == 'STP':
+            self._rows = None
+        elif name == 'HLP':
+            for line in HELP_TEXT:
+                self._reply(line)
+        elif name == 'WIN':
+            if argument:
+                self.window = float(argument) * 1e-9
+            self._reply('Coincidence window: %g ns' % (self.window * 1e9))
+        else:
+            self._reply('OK')
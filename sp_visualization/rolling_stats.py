@@ -0,0 +1,197 @@
+# Justin Smethers
+# Purdue Fort Wayne Physics
+# Advised by Dr. Mark Masters
+
+import numpy as np
+
+from .accidentals import DEFAULT_GATE_TIME, channel_letters
+
+
+'''
+Live statistics of a run, to judge the alignment while it's going instead of from the saved file afterwards.
+
+RollingStats is updated with every batch of samples the Session records (counts, coincidences and accidentals in
+display order) and keeps, in a few NumPy arrays:
+
+    - the mean and standard deviation of every channel over the whole run, with Welford's algorithm (batches are
+      merged with Chan's formula, so the cost doesn't depend on how long the run has been going)
+    - the rate of every channel over the last `window` samples, from a ring of the latest samples and their sum
+    - the coincidence to accidental ratio (CAR) of every coincident channel whose accidentals are computed, over the
+      same window
+    - the heralded g2(0) = N_h * N_hab / (N_ha * N_hb) of every triple coincidence hab whose herald h, pairs ha and hb
+      are selected too. Around 0 for single photons, 1 for coherent light
+
+The channels it relates are found from their names, so it works with the namespaced channels of several devices.
+'''
+
+
+#
+# RollingStats
+# Incremental statistics of every recorded channel
+class RollingStats:
+    #
+    # @params: channel_list - names of the recorded channels, in the order of the columns of the batches
+    #          window - number of most recent samples the rates, CAR and g2 are taken over
+    #          gate_time - seconds of counting per sample
+    def __init__(self, channel_list, window=100, gate_time=DEFAULT_GATE_TIME):
+        self.channel_list = list(channel_list)
+        self.window = window
+        self.gate_time = gate_time
+        n_channels = len(self.channel_list)
+
+        # Welford state of every channel over the whole run
+        self.count = 0
+        self.mean = np.zeros(n_channels)
+        self._m2 = np.zeros(n_channels)
+
+        # Latest window samples and their sum
+        self._ring = np.zeros((window, n_channels))
+        self._ring_pos = 0
+        self._ring_filled = 0
+        self._window_sum = np.zeros(n_channels)
+
+        # Column of every channel, by device prefix and letters
+        columns = {}
+        for i in range(n_channels):
+            prefix, kind, letters = _split_name(self.channel_list[i])
+            columns[(prefix, kind, frozenset(letters))] = i
+
+        # (coincident column, accidentals column) of every coincident channel with accidentals
+        self.car_channels = []
+        # (herald, pair with a, pair with b, triple) columns of every heralded g2 that can be measured
+        self.g2_channels = []
+        self.g2_labels = []
+        for i in range(n_channels):
+            prefix, kind, letters = _split_name(self.channel_list[i])
+            if kind != 'Channel' or len(letters) < 2:
+                continue
+            noise = columns.get((prefix, 'Noise', frozenset(letters)))
+            if noise is not None:
+                self.car_channels.append((i, noise))
+            if len(letters) == 3:
+                for herald in letters:
+                    a, b = [letter for letter in letters if letter != herald]
+                    needed = [columns.get((prefix, 'Channel', frozenset(key))) for key in (herald, herald + a,
+                                                                                           herald + b)]
+                    if None not in needed:
+                        self.g2_channels.append(tuple(needed) + (i,))
+                        self.g2_labels.append(herald)
+        self._car = np.array(self.car_channels, dtype=np.intp).reshape(len(self.car_channels), 2)
+        self._g2 = np.array(self.g2_channels, dtype=np.intp).reshape(len(self.g2_channels), 4)
+
+    #
+    # update
+    # @params: rows - 2d array of a batch of samples, a column per channel
+    # @returns: none
+    def update(self, rows):
+        rows = np.asarray(rows, dtype=np.float64)
+        n_rows = len(rows)
+        if n_rows == 0:
+            return
+
+        # Merge the mean and sum of squared differences of the batch into the running ones
+        batch_mean = rows.mean(axis=0)
+        batch_m2 = ((rows - batch_mean) ** 2).sum(axis=0)
+        total = self.count + n_rows
+        delta = batch_mean - self.mean
+        self.mean += delta * (n_rows / total)
+        self._m2 += batch_m2 + delta ** 2 * (self.count * n_rows / total)
+        self.count = total
+
+        # Move the window on
+        if n_rows >= self.window:
+            self._ring[:] = rows[-self.window:]
+            self._ring_pos = 0
+            self._ring_filled = self.window
+            self._window_sum = self._ring.sum(axis=0)
+            return
+        # The ring starts as zeros, so the slots overwritten can always be taken out of the sum
+        positions = (self._ring_pos + np.arange(n_rows)) % self.window
+        self._window_sum -= self._ring[positions].sum(axis=0)
+        self._ring[positions] = rows
+        self._window_sum += rows.sum(axis=0)
+        self._ring_pos = (self._ring_pos + n_rows) % self.window
+        self._ring_filled = min(self.window, self._ring_filled + n_rows)
+
+    #
+    # std
+    # @returns: standard deviation of every channel over the whole run
+    @property
+    def std(self):
+        if self.count < 2:
+            return np.zeros(len(self.channel_list))
+        return np.sqrt(self._m2 / (self.count - 1))
+
+    #
+    # rates
+    # @returns: counts per second of every channel over the window
+    @property
+    def rates(self):
+        if self._ring_filled == 0:
+            return np.zeros(len(self.channel_list))
+        return self._window_sum / (self._ring_filled * self.gate_time)
+
+    #
+    # car
+    # @returns: coincidence to accidental ratio over the window of every channel in car_channels, nan where there
+    #           are no accidentals
+    @property
+    def car(self):
+        coincidences = self._window_sum[self._car[:, 0]]
+        accidentals = self._window_sum[self._car[:, 1]]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(accidentals > 0, coincidences / accidentals, np.nan)
+
+    #
+    # g2
+    # @returns: heralded g2(0) over the window of every entry of g2_channels, nan while a pair hasn't been seen
+    @property
+    def g2(self):
+        herald, pair_a, pair_b, triple = [self._window_sum[self._g2[:, i]] for i in range(4)]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(pair_a * pair_b > 0, herald * triple / (pair_a * pair_b), np.nan)
+
+    #
+    # annotations
+    # Short text of the statistics of each channel, for the captions of the live plot
+    # @params: none
+    # @returns: dict of channel name to text
+    def annotations(self):
+        rates = self.rates
+        std = self.std
+        text = {}
+        for i in range(len(self.channel_list)):
+            text[self.channel_list[i]] = '%s/s  sd %.0f' % (_si(rates[i]), std[i])
+        car = self.car
+        for j in range(len(self.car_channels)):
+            name = self.channel_list[self.car_channels[j][0]]
+            text[name] += '  CAR %.1f' % car[j]
+        g2 = self.g2
+        for j in range(len(self.g2_channels)):
+            name = self.channel_list[self.g2_channels[j][3]]
+            text[name] += '  g2 %.3f|%s' % (g2[j], self.g2_labels[j])
+        return text
+
+    #
+    # summary
+    # @params: none
+    # @returns: multi-line text of the statistics of every channel, eg for the console at the end of a run
+    def summary(self):
+        annotations = self.annotations()
+        lines = ['%d samples, rates over the last %d' % (self.count, min(self.count, self.window))]
+        for i in range(len(self.channel_list)):
+            name = self.channel_list[i]
+            lines.append('  %s: mean %.1f  %s' % (name, self.mean[i], annotations[name]))
+        return '\n'.join(lines)
+
+
+def _split_name(name):
+    prefix, separator, channel = name.rpartition(': ')
+    return prefix, channel.split()[0], channel_letters(channel)
+
+
+def _si(value):
+    for factor, suffix in ((1e6, 'M'), (1e3, 'k')):
+        if abs(value) >= factor:
+            return '%.1f%s' % (value / factor, suffix)
+    return '%.1f' % value
@@ -0,0 +1,507 @@
+# Justin Smethers
+# Purdue Fort Wayne Physics
+# Advised by Dr. Mark Masters
+
+import os
+import threading
+
+import numpy as np
+
+from .accidentals import DEFAULT_WINDOW, AccidentalsEngine, parse_window_reply
+from .acquisition import SampleRingBuffer, SerialReader
+from .multidevice import MergedBuffer, device_names, namespaced
+from .display import DisplaySink
+from .psoc_client import CommandClient, gather, run
+from .recorder import open_recorder
+from .rolling_stats import RollingStats
+from .sweep import SweepError, SweepResult, format_step, format_value
+from .telemetry import PipelineTelemetry, TelemetryLogger, format_telemetry
+
+
+'''
+A Session owns the serial connection and the figure for as long as the script runs, so any number of STA/STP runs,
+with different channels each time, can be made one after another without re-opening the port or rebuilding the
+figure. Each run gets a fresh ring buffer, reader thread, recorder and telemetry; stop() stops them all and checks
+that none of the threads are left running.
+
+A Session can also run several PSoC units at once. Each device is read by its own thread, and the samples are merged
+onto one timeline by a MergedBuffer and shown and recorded together, with the channels of each device prefixed by
+its name. Accidentals are only computed between channels of the same device.
+
+While recording, the processing thread keeps RollingStats of the run (rates, spread, CAR and heralded g2(0) of every
+channel), shown in the captions of the display.
+
+Drawing is left to an optional DisplaySink. The processing thread records every sample and hands each batch to the
+display, which redraws at its own limited rate. A headless Session has no display and never imports matplotlib, and
+a display can be attached or detached at any time, even during a run.
+
+sweep() steps a PSoC setting (eg the DAC threshold or the coincidence window) over a range of values in a single
+acquisition, so the devices never sit idle between the steps, and aggregates the counts, accidentals and CAR of every
+step into a SweepResult.
+
+Commands go through a CommandClient per device, which reads each reply only until the device goes quiet. Commands
+and channel configurations are sent to every device at once.
+'''
+
+# CHN command for each channel name accepted by channel_config
+CHANNEL_COMMANDS = {
+    'A': 'CHN1000', 'B': 'CHN0100', 'C': 'CHN0010', 'D': 'CHN0001',
+    'AB': 'CHN1100', 'AC': 'CHN1010', 'AD': 'CHN1001', 'BC': 'CHN0110', 'BD': 'CHN0101', 'CD': 'CHN0011',
+    'ABC': 'CHN1110', 'ABD': 'CHN1101', 'ACD': 'CHN1011', 'BCD': 'CHN0111',
+    'ABCD': 'CHN1111',
+}
+
+
+#
+# channel_config
+# Works out the channels and the CHN settings of the counters from the names the user entered
+# @params: name_list - comma separated names of channels, eg 'A,B,AB'. Unknown names are skipped
+# @returns: individual_channel_list - list of string names of individual channels to be used
+#           coincident_channel_list - list of string names of coincident channels to be used
+#           chn_list - CHN command of each counter, individual channels first
+def channel_config(name_list):
+    individual_channel_list = []
+    coincident_channel_list = []
+    individual_chn_list = []
+    coincident_chn_list = []
+    for name in name_list.split(','):
+        name = name.strip().upper()
+        if name not in CHANNEL_COMMANDS:
+            continue
+        if len(name) == 1:
+            individual_channel_list.append('Channel ' + name)
+            individual_chn_list.append(CHANNEL_COMMANDS[name])
+        else:
+            coincident_channel_list.append('Channel ' + name)
+            coincident_chn_list.append(CHANNEL_COMMANDS[name])
+    return individual_channel_list, coincident_channel_list, individual_chn_list + coincident_chn_list
+
+
+#
+# Session
+# Runs the PSoC from one process for any number of runs
+class Session:
+    batch_interval = 0.05     # max seconds the processing thread waits for samples before checking for a stop
+    #
+    # @params: ser - open serial.Serial (or ReplaySerial), or a list of them to run several devices at once, or a
+    #                function returning them, which is only called when the devices are first used
+    #          directory - directory runs are saved in
+    #          save_format - 'csv' or 'npy'
+    #          coincidence_window - coincidence window in seconds used for the accidentals, updated by WIN replies
+    #          blit - only redraw the lines and captions each frame instead of the whole figure
+    #          window_size - max number of points per plot
+    #          frame_rate - max number of redraws per second
+    #          headless - only record and compute the accidentals, without a display
+    #          connect_commands - commands sent to the devices as soon as they are connected, eg ('ECO 1',)
+    def __init__(self, ser, directory='.', save_format='csv', coincidence_window=DEFAULT_WINDOW, blit=True,
+                 window_size=50, frame_rate=10, headless=False, connect_commands=()):
+        self.devices = []
+        self.device_names = []
+        self.ser = None
+        self.clients = []
+        self.connect_commands = tuple(connect_commands)
+        self._opener = ser if callable(ser) else None
+        self.directory = directory
+        self.save_format = save_format
+        self.coincidence_window = coincidence_window
+        self.blit = blit
+        self.window_size = window_size
+        self.frame_rate = frame_rate
+
+        # State of the current run
+        self.device_channels = []         # (individual_channel_list, coincident_channel_list) of each device
+        self.individual_channel_list = []
+        self.coincident_channel_list = []
+        self.noise_channel_list = []
+        self.buffer = None
+        self.readers = []
+        self.telemetry = None
+        self.stats = None
+        self.recorder_path = None
+        self.error = None
+        self._process_thread = None
+        self._engines = []
+        self._columns = None
+        self._stop_event = threading.Event()
+        self._stopping = threading.Event()     # STP has been sent, devices going quiet is expected
+
+        self.display = None
+        if not headless:
+            self.attach_display()
+        if self._opener is None:
+            self._set_devices(ser)
+
+    #
+    # connected
+    # @returns: True once the devices are open
+    @property
+    def connected(self):
+        return bool(self.devices)
+
+    #
+    # connect
+    # Opens the devices if they aren't yet. Called by every method that talks to them
+    # @params: none
+    # @returns: none
+    def connect(self):
+        if not self.connected:
+            self._set_devices(self._opener())
+
+    #
+    # running
+    # @returns: True while a run is in progress
+    @property
+    def running(self):
+        return self._process_thread is not None and self._process_thread.is_alive()
+
+    #
+    # reader
+    # @returns: SerialReader of the first device
+    @property
+    def reader(self):
+        return self.readers[0] if self.readers else None
+
+    #
+    # attach_display
+    # Shows the runs in a figure. If a run is in progress it's shown from its next batch on
+    # @params: display - DisplaySink, a new one with the session's settings by default
+    # @returns: the attached DisplaySink
+    def attach_display(self, display=None):
+        self.detach_display()
+        if display is None:
+            display = DisplaySink(window_size=self.window_size, max_fps=self.frame_rate, blit=self.blit)
+        if self.running:
+            display.start_run(self.individual_channel_list, self.coincident_channel_list + self.noise_channel_list,
+                              self.telemetry)
+        self.display = display
+        return display
+
+    #
+    # detach_display
+    # Closes the figure. Runs carry on being recorded
+    # @params: none
+    # @returns: none
+    def detach_display(self):
+        display = self.display
+        self.display = None
+        if display is not None:
+            display.close()
+
+    #
+    # command
+    # Sends a command to every device and collects the replies
+    # @params: entry - command, eg 'HLP' or 'WIN 5'
+    # @returns: list of the lines of the replies, prefixed with the device name if there are several devices
+    def command(self, entry):
+        self.connect()
+        replies = run(gather([client.command(entry) for client in self.clients]))
+        reply = []
+        for i in range(len(self.devices)):
+            reply += self._namespaced(i, replies[i])
+        if entry.upper().startswith('WIN'):
+            window = parse_window_reply(reply)
+            if window is not None:
+                self.coincidence_window = window
+        return reply
+
+    #
+    # configure
+    # Works out the channels of every device and sends their CHN settings, in one exchange per device, all at once
+    # @params: name_list - comma separated names of channels, eg 'A,B,AB'. With several devices the channels of each
+    #                      device can be given separated by ';', eg 'A,B,AB;C,D,CD', otherwise every device uses the
+    #                      same channels
+    # @returns: none
+    def configure(self, name_list):
+        self.connect()
+        name_lists = name_list.split(';')
+        if len(name_lists) == 1:
+            name_lists = name_lists * len(self.devices)
+        elif len(name_lists) != len(self.devices):
+            raise ValueError('Expected channels for %d devices, got %d' % (len(self.devices), len(name_lists)))
+
+        self.device_channels = []
+        self.individual_channel_list = []
+        self.coincident_channel_list = []
+        chn_lists = []
+        for i in range(len(self.devices)):
+            individual_channel_list, coincident_channel_list, chn_list = channel_config(name_lists[i])
+            if len(self.devices) > 1:
+                print(self.device_names[i] + ':')
+            print('Individual channel list:', individual_channel_list)
+            print('Coincident channel list:', coincident_channel_list)
+            self.device_channels.append((individual_channel_list, coincident_channel_list))
+            self.individual_channel_list += self._namespaced(i, individual_channel_list)
+            self.coincident_channel_list += self._namespaced(i, coincident_channel_list)
+            chn_lists.append(chn_list)
+        run(gather([self.clients[i].configure_channels(chn_lists[i]) for i in range(len(self.devices))]))
+
+        # Add a noise plot for every coincident channel whose individual channels are selected on the same device.
+        # _columns puts the merged counters of all the devices in display order: every individual channel, then every
+        # coincident channel
+        self._engines = []
+        self.noise_channel_list = []
+        individual_columns = []
+        coincident_columns = []
+        start = 0
+        for i in range(len(self.devices)):
+            individual_channel_list, coincident_channel_list = self.device_channels[i]
+            engine = AccidentalsEngine(individual_channel_list, coincident_channel_list, window=self.coincidence_window)
+            self._engines.append((engine, start))
+            self.noise_channel_list += self._namespaced(i, engine.channel_list)
+            individual_columns += range(start, start + len(individual_channel_list))
+            start += len(individual_channel_list)
+            coincident_columns += range(start, start + len(coincident_channel_list))
+            start += len(coincident_channel_list)
+        self._columns = np.array(individual_columns + coincident_columns, dtype=np.intp)
+
+    #
+    # channel_list
+    # @returns: names of the columns of the rows of a run: individual, coincident, then accidentals channels
+    @property
+    def channel_list(self):
+        return self.individual_channel_list + self.coincident_channel_list + self.noise_channel_list
+
+    #
+    # start
+    # Configures the channels and starts a run. The figure is updated from a separate thread until stop is called
+    # @params: name_list - comma separated names of channels, see configure
+    # @returns: none
+    def start(self, name_list):
+        if self.running:
+            raise RuntimeError('A run is already in progress')
+        self.configure(name_list)
+        self.stats = RollingStats(self.channel_list)
+        self.error = None
+        self._stop_event.clear()
+        self._stopping.clear()
+        self._start_readers()
+
+        if self.display is not None:
+            self.display.start_run(self.individual_channel_list,
+                                   self.coincident_channel_list + self.noise_channel_list, self.telemetry)
+        self._process_thread = threading.Thread(target=self._process, name='Processing', daemon=True)
+        self._process_thread.start()
+
+    #
+    # sweep
+    # Steps a PSoC setting over a range of values in one continuous acquisition. The devices keep streaming between
+    # the steps: as soon as a step has its samples the next value is sent, and the samples counted before it took
+    # effect are dropped. The samples are only aggregated, nothing is recorded
+    # @params: name_list - comma separated names of channels, see configure
+    #          parameter - PSoC command setting the value, eg 'DAC' or 'WIN'. WIN values are in ns and are also used
+    #                      as the window of the accidentals
+    #          values - value of each step
+    #          n_samples - samples aggregated per step
+    #          settle - samples dropped after each value is sent, counted partly before it took effect
+    # @returns: SweepResult
+    # @raises: SweepError, holding the steps that did finish, if the devices stop streaming
+    def sweep(self, name_list, parameter, values, n_samples=100, settle=2):
+        if self.running:
+            raise RuntimeError('A run is already in progress')
+        parameter = parameter.upper()
+        self.configure(name_list)
+        self._process_thread = None
+        result = SweepResult(parameter, values, self.channel_list)
+        self.stats = RollingStats(self.channel_list, window=n_samples)
+        self.error = None
+        self._stop_event.clear()
+        self._stopping.clear()
+        self._set_sweep_value(parameter, result.values[0])
+        self._start_readers()
+        if self.display is not None:
+            self.display.start_run(self.individual_channel_list,
+                                   self.coincident_channel_list + self.noise_channel_list, self.telemetry)
+
+        step = 0
+        taken = 0             # samples of the current step read so far, including the dropped ones
+        try:
+            while step < len(result.values):
+                samples = self.buffer.drain(timeout=self.batch_interval)
+                if getattr(self.buffer, 'stopped', []):
+                    device = self.device_names[self.buffer.stopped[0]]
+                    raise SweepError('%s stopped streaming at step %d of the sweep' % (device, step + 1), result)
+                if not samples:
+                    if self.buffer.closed:
+                        raise SweepError('The devices stopped streaming at step %d of the sweep' % (step + 1), result)
+                    continue
+                counts = np.array(samples, dtype=np.int64)
+                self.telemetry.record_samples(len(counts))
+                needed = settle + n_samples - taken
+                rows = self._rows(counts[:needed])
+                self.stats.update(rows[max(0, settle - taken):])
+                taken += len(rows)
+                if self.display is not None:
+                    self.display.set_annotations(self.stats.annotations())
+                    self.display.push(rows)
+                if taken < settle + n_samples:
+                    continue
+
+                result.add(step, self.stats)
+                print(format_step(result, step))
+                step += 1
+                if step < len(result.values):
+                    # The rest of the batch, and whatever is still queued, was counted with the old value
+                    self.buffer.drain(timeout=0)
+                    for ser in self.devices:
+                        ser.write(('%s %s\r\n' % (parameter, format_value(result.values[step]))).encode())
+                    self._set_sweep_window(parameter, result.values[step])
+                    self.stats = RollingStats(self.channel_list, window=n_samples)
+                    taken = 0
+        finally:
+            self.stop()
+        return result
+
+    #
+    # stop
+    # Stops the run. The readers keep draining the devices until they go quiet, the processing thread then saves the
+    # run.
+    # If a device doesn't go quiet within timeout seconds the threads are told to stop anyway
+    # @params: timeout - seconds to wait for each thread
+    # @returns: list of the names of threads that failed to stop
+    def stop(self, timeout=5):
+        if not self.readers:
+            return []
+        self._stopping.set()
+        for ser in self.devices:
+            ser.write('STP\r\n'.encode())
+        for reader in self.readers:
+            reader.join(timeout)
+            if reader.is_alive():
+                reader.stop()
+                self._stop_event.set()
+                reader.join(timeout)
+        # A sweep has no processing thread, its samples are taken by the thread that runs it
+        threads = list(self.readers)
+        if self._process_thread is not None:
+            self._process_thread.join(timeout)
+            if self._process_thread.is_alive():
+                self._stop_event.set()
+                self._process_thread.join(timeout)
+            threads.append(self._process_thread)
+        return [thread.name for thread in threads if thread.is_alive()]
+
+    #
+    # close
+    # Stops any run in progress, closes the display and the serial ports
+    # @params: none
+    # @returns: none
+    def close(self):
+        if self.running:
+            self.stop()
+        self.detach_display()
+        for ser in self.devices:
+            ser.close()
+
+    #
+    # _start_readers
+    # Starts the data collection devices, then a reader thread for each that drains it into its ring buffer
+    def _start_readers(self):
+        run(gather([client.start_acquisition() for client in self.clients]))
+        buffers = []
+        widths = []
+        self.readers = []
+        # With several devices every lost sample leaves a Gap, so the MergedBuffer keeps them in step
+        mark_gaps = len(self.devices) > 1
+        for i in range(len(self.devices)):
+            buffers.append(SampleRingBuffer(mark_gaps=mark_gaps))
+            widths.append(len(self.device_channels[i][0]) + len(self.device_channels[i][1]))
+        self.buffer = buffers[0] if len(buffers) == 1 else MergedBuffer(buffers, widths)
+        self.telemetry = PipelineTelemetry(self.buffer)
+        for i in range(len(self.devices)):
+            reader = SerialReader(self.devices[i], buffers[i], widths[i], self.telemetry, mark_gaps=mark_gaps)
+            reader.name = 'SerialReader ' + self.device_names[i]
+            self.readers.append(reader)
+            reader.start()
+
+    #
+    # _rows
+    # Puts a batch of samples in display order and adds the accidental coincidences of the whole batch at once
+    # @params: counts - 2d int array of merged counters, a row per sample
+    # @returns: 2d float array, a column per channel of channel_list. The accidentals aren't rounded, so the statistics
+    #           and the run file get their exact values
+    def _rows(self, counts):
+        noise = [engine.compute(counts[:, start:]) for engine, start in self._engines]
+        return np.hstack([counts[:, self._columns]] + noise)
+
+    #
+    # _set_sweep_value
+    # Sends the value of a sweep step to every device and waits for the replies, before the acquisition is started
+    def _set_sweep_value(self, parameter, value):
+        self.command('%s %s' % (parameter, format_value(value)))
+        self._set_sweep_window(parameter, value)
+
+    def _set_sweep_window(self, parameter, value):
+        if parameter == 'WIN':
+            self.coincidence_window = value * 1e-9
+            for engine, start in self._engines:
+                engine.window = self.coincidence_window
+
+    def _set_devices(self, ser):
+        self.devices = list(ser) if isinstance(ser, (list, tuple)) else [ser]
+        self.device_names = device_names(self.devices)
+        self.ser = self.devices[0]
+        self.clients = [CommandClient(ser) for ser in self.devices]
+        for entry in self.connect_commands:
+            self.command(entry)
+        # The accidentals use the window the device is set to, not a default that may not match it
+        self.command('WIN')
+
+    def _namespaced(self, device, names):
+        if len(self.devices) == 1:
+            return list(names)
+        return [namespaced(self.device_names[device], name) for name in names]
+
+    #
+    # _process
+    # Target of the processing thread. Consumes the ring buffer until the readers have stopped and the buffer is
+    # empty, computes the accidentals, streams every sample to the run file and passes it on to the display
+    def _process(self):
+        coincident_channel_list = self.coincident_channel_list + self.noise_channel_list
+
+        # Every sample is streamed to the run file as it arrives
+        recorder = open_recorder(self.individual_channel_list + coincident_channel_list, self.directory,
+                                 self.save_format)
+        self.recorder_path = recorder.path
+        print('Saving run to', recorder.path)
+
+        # Log the pipeline telemetry next to the run and keep the status panel up to date
+        logger = TelemetryLogger(self.telemetry, os.path.splitext(recorder.path)[0] + '_telemetry.jsonl')
+        logger.start()
+        snapshot = None
+        reported = 0
+
+        try:
+            while not self._stop_event.is_set():
+                # Take every sample that arrived since the last batch
+                samples = self.buffer.drain(timeout=self.batch_interval)
+                stopped = getattr(self.buffer, 'stopped', [])
+                if len(stopped) > reported and not self._stopping.is_set():
+                    for device in stopped[reported:]:
+                        print('\nWARNING %s stopped streaming, its channels are recorded as 0 from now on'
+                              % self.device_names[device])
+                reported = len(stopped)
+                if not samples:
+                    if self.buffer.closed:
+                        break
+                    continue
+
+                # Calculate the accidental coincidences of the whole batch at once
+                rows = self._rows(np.array(samples, dtype=np.int64))
+                recorder.extend(rows)
+                self.stats.update(rows)
+                self.telemetry.record_samples(len(rows))
+
+                display = self.display
+                if display is not None:
+                    if self.telemetry.latest is not snapshot:
+                        snapshot = self.telemetry.latest
+                        display.set_status(format_telemetry(snapshot))
+                    display.set_annotations(self.stats.annotations())
+                    display.push(rows)
+        except Exception as e:
+            self.error = e
+        finally:
+            recorder.close()
+            logger.stop()
+            logger.join()
+            print('Successfully saved data to', recorder.path)
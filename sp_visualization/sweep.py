@@ -0,0 +1,225 @@
+# Justin Smethers
+# Purdue Fort Wayne Physics
+# Advised by Dr. Mark Masters
+
+import csv
+import os
+import time
+
+import numpy as np
+
+from .rolling_stats import RollingStats
+
+
+'''
+Parameter sweeps, eg of the DAC threshold or the coincidence window.
+
+Session.sweep steps a PSoC setting over a range of values and aggregates a fixed number of samples at each step into
+a SweepResult: the mean and standard deviation of every channel (counts and accidentals), and the CAR and heralded
+g2(0) of the channels that have them, one row per step. The result is written as a table next to the runs, and
+plotted against the value of the setting.
+
+From the script:
+
+    swp dac 100 200 10        steps DAC from 100 to 200 in steps of 10, with 100 samples per step
+    swp win 1 10 1 50         steps the coincidence window from 1 to 10 ns, with 50 samples per step
+'''
+
+SWEEP_PREFIX = 'sweep_'
+DEFAULT_SAMPLES = 100
+USAGE = "Use 'swp <setting> <start> <stop> <step> [samples per step]', eg 'swp dac 100 200 10'"
+
+
+#
+# SweepError
+# Raised when a sweep can't be finished, eg a device stopped streaming. result holds the steps that did finish
+class SweepError(RuntimeError):
+    #
+    # @params: message - what went wrong
+    #          result - SweepResult of the sweep so far
+    def __init__(self, message, result):
+        RuntimeError.__init__(self, message)
+        self.result = result
+
+
+#
+# sweep_values
+# @params: start / stop - first and last value, stop is included if the steps land on it
+#          step - difference between two steps, negative to sweep down
+# @returns: float array of the values of the steps
+# @raises: ValueError if step is 0 or goes away from stop
+def sweep_values(start, stop, step):
+    if step == 0 or (stop - start) * step < 0:
+        raise ValueError('A step of %g never goes from %g to %g' % (step, start, stop))
+    n_steps = int(np.floor((stop - start) / step + 1e-9)) + 1
+    return start + step * np.arange(n_steps)
+
+
+#
+# parse_sweep
+# Reads a sweep command entered in the script
+# @params: entry - eg 'swp dac 100 200 10' or 'swp win 1 10 1 50'
+# @returns: parameter - PSoC command of the setting, eg 'DAC'
+#           values - float array of the values of the steps
+#           n_samples - samples per step
+# @raises: ValueError if the command can't be read
+def parse_sweep(entry):
+    words = entry.split()
+    if len(words) not in (5, 6):
+        raise ValueError(USAGE)
+    try:
+        values = sweep_values(float(words[2]), float(words[3]), float(words[4]))
+        n_samples = int(words[5]) if len(words) == 6 else DEFAULT_SAMPLES
+    except ValueError as e:
+        raise ValueError('%s. %s' % (e, USAGE))
+    if n_samples < 1:
+        raise ValueError('A step needs at least 1 sample')
+    return words[1].upper(), values, n_samples
+
+
+#
+# format_value
+# @params: value - value of a step
+# @returns: value as sent to the PSoC, eg '120' or '2.5'
+def format_value(value):
+    return '%g' % value
+
+
+#
+# SweepResult
+# Statistics of every channel at every step of a sweep
+class SweepResult:
+    #
+    # @params: parameter - PSoC command of the setting swept, eg 'DAC'
+    #          values - value of each step
+    #          channel_list - names of the channels, in the order of the columns of the samples
+    def __init__(self, parameter, values, channel_list):
+        self.parameter = parameter
+        self.values = np.asarray(values, dtype=np.float64)
+        self.channel_list = list(channel_list)
+        n_steps = len(self.values)
+
+        # Channels with a CAR and a g2 are found the same way as during a run
+        stats = RollingStats(self.channel_list, window=1)
+        self.car_channel_list = [self.channel_list[i] for i, noise in stats.car_channels]
+        self.g2_channel_list = [self.channel_list[stats.g2_channels[j][3]] + '|' + stats.g2_labels[j]
+                                for j in range(len(stats.g2_channels))]
+
+        self.completed = 0        # number of steps added so far, the table and the plot only show those
+        self.samples = np.zeros(n_steps, dtype=np.int64)
+        self.mean = np.full((n_steps, len(self.channel_list)), np.nan)
+        self.std = np.full((n_steps, len(self.channel_list)), np.nan)
+        self.car = np.full((n_steps, len(self.car_channel_list)), np.nan)
+        self.g2 = np.full((n_steps, len(self.g2_channel_list)), np.nan)
+
+    def __len__(self):
+        return len(self.values)
+
+    #
+    # add
+    # Stores the statistics of a step
+    # @params: step - index of the step
+    #          stats - RollingStats of the samples of the step, with a window of at least that many samples
+    # @returns: none
+    def add(self, step, stats):
+        self.completed = max(self.completed, step + 1)
+        self.samples[step] = stats.count
+        self.mean[step] = stats.mean
+        self.std[step] = stats.std
+        self.car[step] = stats.car
+        self.g2[step] = stats.g2
+
+    #
+    # fields
+    # @returns: names of the columns of the table
+    def fields(self):
+        fields = [self.parameter, 'samples']
+        for name in self.channel_list:
+            fields += [name + ' mean', name + ' std']
+        fields += ['CAR ' + name for name in self.car_channel_list]
+        fields += ['g2 ' + name for name in self.g2_channel_list]
+        return fields
+
+    #
+    # table
+    # @returns: 2d float array, a row per completed step and a column per field
+    def table(self):
+        n = self.completed
+        spread = np.empty((n, 2 * len(self.channel_list)))
+        spread[:, 0::2] = self.mean[:n]
+        spread[:, 1::2] = self.std[:n]
+        return np.column_stack([self.values[:n], self.samples[:n], spread, self.car[:n], self.g2[:n]])
+
+
+#
+# format_step
+# @params: result - SweepResult
+#          step - index of a step that has been added
+# @returns: one line of the mean of every channel and the CAR at the step, for the console
+def format_step(result, step):
+    text = '%s %s:' % (result.parameter, format_value(result.values[step]))
+    for i in range(len(result.channel_list)):
+        text += '  %s %.1f' % (result.channel_list[i], result.mean[step, i])
+    for j in range(len(result.car_channel_list)):
+        text += '  CAR %s %.1f' % (result.car_channel_list[j], result.car[step, j])
+    return text
+
+
+#
+# sweep_file_name
+# Builds a timestamped file name for a sweep, eg sweep_dac_20240131_142501.csv
+# @params: parameter - PSoC command of the setting swept
+#          directory - directory the sweep is saved in
+# @returns: path to the new table, without overwriting an earlier one
+def sweep_file_name(parameter, directory='.'):
+    name = SWEEP_PREFIX + parameter.lower() + '_' + time.strftime('%Y%m%d_%H%M%S')
+    path = os.path.join(directory, name + '.csv')
+    suffix = 1
+    while os.path.exists(path):
+        path = os.path.join(directory, '%s_%d.csv' % (name, suffix))
+        suffix += 1
+    return path
+
+
+#
+# write_sweep
+# @params: result - SweepResult
+#          path - path of the csv table
+# @returns: none
+def write_sweep(result, path):
+    with open(path, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(result.fields())
+        for row in result.table().tolist():
+            writer.writerow(['%.6g' % value for value in row])
+
+
+#
+# plot_sweep
+# Plots the mean counts of every channel, with their standard deviation, and the CAR against the value of the setting,
+# for the completed steps.
+# Drawn on a Figure of its own, without pyplot, so it doesn't touch the live display
+# @params: result - SweepResult
+#          path - path of the image, eg .png
+# @returns: none
+def plot_sweep(result, path):
+    from matplotlib.figure import Figure
+
+    n = result.completed
+    n_plots = 2 if result.car_channel_list else 1
+    figure = Figure(figsize=(8, 4 * n_plots))
+    axes = figure.subplots(n_plots, 1, sharex=True, squeeze=False)[:, 0]
+    for i in range(len(result.channel_list)):
+        axes[0].errorbar(result.values[:n], result.mean[:n, i], yerr=result.std[:n, i], marker='o', markersize=3,
+                         capsize=2, label=result.channel_list[i])
+    axes[0].set_ylabel('Counts per sample')
+    axes[0].legend(fontsize='small')
+    if result.car_channel_list:
+        for j in range(len(result.car_channel_list)):
+            axes[1].plot(result.values[:n], result.car[:n, j], marker='o', markersize=3,
+                         label='CAR ' + result.car_channel_list[j])
+        axes[1].set_ylabel('Coincidence to accidental ratio')
+        axes[1].legend(fontsize='small')
+    axes[-1].set_xlabel(result.parameter + (' (ns)' if result.parameter == 'WIN' else ''))
+    figure.tight_layout()
+    figure.savefig(path)
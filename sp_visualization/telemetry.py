@@ -0,0 +1,173 @@
+# Justin Smethers
+# Purdue Fort Wayne Physics
+# Advised by Dr. Mark Masters
+
+import json
+import threading
+import time
+
+
+'''
+Live instrumentation of the acquisition pipeline.
+
+The SerialReader, the Session and its display report every line read, every sample processed and every frame drawn
+to a PipelineTelemetry. Once per interval a TelemetryLogger turns the counters into rates (bytes and lines read per
+second, parse time, frame time, queue depth between reader and renderer, dropped and malformed lines), writes them as
+one JSON object per line to a log next to the run, and warns on the console as soon as processing starts falling
+behind. The display shows the latest numbers in the bottom panel of the figure.
+'''
+
+
+#
+# PipelineTelemetry
+# Counters and timers shared by the reader threads and the render loop
+class PipelineTelemetry:
+    #
+    # @params: buffer - SampleRingBuffer between the reader and the renderer, for the queue depth and dropped samples
+    def __init__(self, buffer=None):
+        self.buffer = buffer
+        self.started = time.time()
+
+        # Written by the reader threads, one per device
+        self._lock = threading.Lock()
+        self.bytes_read = 0
+        self.lines_read = 0
+        self.malformed_lines = 0
+        self.parse_time = 0.0
+
+        # Written by the processing thread
+        self.samples_processed = 0
+
+        # Written by the display
+        self.frames = 0
+        self.frame_time = 0.0
+        self._frame_time_max = 0.0
+
+        self.latest = None        # last snapshot made by update
+        self._last = None
+
+    #
+    # record_lines
+    # @params: n_lines - number of lines read
+    #          n_bytes - number of bytes read
+    #          parse_time - seconds spent parsing them
+    #          malformed - number of those lines that were corrupt and skipped
+    # @returns: none
+    def record_lines(self, n_lines, n_bytes, parse_time, malformed=0):
+        with self._lock:
+            self.bytes_read += n_bytes
+            self.lines_read += n_lines
+            self.parse_time += parse_time
+            self.malformed_lines += malformed
+
+    #
+    # record_samples
+    # @params: n_samples - samples taken from the ring buffer, recorded and passed on to the display
+    # @returns: none
+    def record_samples(self, n_samples):
+        self.samples_processed += n_samples
+
+    #
+    # record_frame
+    # @params: frame_time - seconds spent drawing a frame
+    # @returns: none
+    def record_frame(self, frame_time):
+        self.frames += 1
+        self.frame_time += frame_time
+        if frame_time > self._frame_time_max:
+            self._frame_time_max = frame_time
+
+    #
+    # update
+    # Takes a snapshot of the rates since the previous update. Called periodically by the TelemetryLogger
+    # @params: none
+    # @returns: dict of the current numbers, also kept in self.latest
+    def update(self):
+        now = time.time()
+        counters = (now, self.bytes_read, self.lines_read, self.parse_time, self.samples_processed, self.frames,
+                    self.frame_time)
+        last = self._last if self._last is not None else (self.started, 0, 0, 0.0, 0, 0, 0.0)
+        elapsed = max(now - last[0], 1e-9)
+        lines = counters[2] - last[2]
+        frames = counters[5] - last[5]
+
+        snapshot = {
+            'time': now,
+            'elapsed_s': now - self.started,
+            'bytes_per_s': (counters[1] - last[1]) / elapsed,
+            'lines_per_s': lines / elapsed,
+            'samples_per_s': (counters[4] - last[4]) / elapsed,
+            'parse_us': (counters[3] - last[3]) / lines * 1e6 if lines else 0.0,
+            'frames_per_s': frames / elapsed,
+            'frame_ms': (counters[6] - last[6]) / frames * 1e3 if frames else 0.0,
+            'frame_max_ms': self._frame_time_max * 1e3,
+            'queue_depth': len(self.buffer) if self.buffer is not None else 0,
+            'max_queue_depth': self.buffer.high_watermark if self.buffer is not None else 0,
+            'dropped': self.buffer.overflow_count if self.buffer is not None else 0,
+            'malformed': self.malformed_lines,
+            'lines_read': self.lines_read,
+        }
+        self._frame_time_max = 0.0
+        self._last = counters
+        self.latest = snapshot
+        return snapshot
+
+
+#
+# format_telemetry
+# Formats a snapshot for the status panel of the figure
+# @params: snapshot - dict returned by PipelineTelemetry.update
+# @returns: string
+def format_telemetry(snapshot):
+    return ('Serial: %.0f lines/s  %.1f kB/s   Parse: %.1f us/line   Render: %.1f fps  %.1f ms/frame (max %.1f)\n'
+            'Queue: %d (max %d)   Dropped: %d   Malformed: %d' % (
+                snapshot['lines_per_s'], snapshot['bytes_per_s'] / 1000, snapshot['parse_us'],
+                snapshot['frames_per_s'], snapshot['frame_ms'], snapshot['frame_max_ms'],
+                snapshot['queue_depth'], snapshot['max_queue_depth'], snapshot['dropped'], snapshot['malformed']))
+
+
+#
+# TelemetryLogger
+# Updates the telemetry every interval seconds and writes each snapshot as a line of JSON
+class TelemetryLogger(threading.Thread):
+    #
+    # @params: telemetry - PipelineTelemetry
+    #          path - file the JSON lines are written to, None to only keep telemetry.latest up to date
+    #          interval - seconds between snapshots
+    #          backlog_warning - seconds worth of lines queued (and at least 5 lines) before a lag warning is printed
+    def __init__(self, telemetry, path=None, interval=1.0, backlog_warning=1.0):
+        threading.Thread.__init__(self, name='TelemetryLogger', daemon=True)
+        self.telemetry = telemetry
+        self.path = path
+        self.interval = interval
+        self.backlog_warning = backlog_warning
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def run(self):
+        file = open(self.path, 'w') if self.path is not None else None
+        dropped = 0
+        lagging = False
+        try:
+            while True:
+                stopped = self._stop_event.wait(self.interval)
+                snapshot = self.telemetry.update()
+                if file is not None:
+                    file.write(json.dumps(snapshot) + '\n')
+                    file.flush()
+
+                # Warn while the run is going instead of after it
+                if snapshot['dropped'] > dropped:
+                    print('WARNING %d points dropped, processing is too far behind' % (snapshot['dropped'] - dropped))
+                    dropped = snapshot['dropped']
+                behind = snapshot['queue_depth'] > max(5, snapshot['lines_per_s'] * self.backlog_warning)
+                if behind and not lagging:
+                    print('WARNING processing is %d points behind' % snapshot['queue_depth'])
+                lagging = behind
+                if stopped:
+                    break
+        finally:
+            if file is not None:
+                file.close()
@@ -0,0 +1,24 @@
+import numpy as np
+
+from sp_visualization.accidentals import AccidentalsEngine
+
+
+def test_pair_accidentals_are_2_tau_ri_rj():
+    window, gate_time = 5e-9, 0.1
+    engine = AccidentalsEngine(['Channel A', 'Channel B'], ['Channel AB'], window, gate_time)
+    counts = np.array([[52000, 51000], [10, 0]])
+    rates = counts / gate_time
+    expected = 2 * window * rates[:, 0] * rates[:, 1] * gate_time
+    np.testing.assert_allclose(engine.compute(counts)[:, 0], expected)
+
+
+def test_n_fold_accidentals():
+    window, gate_time = 5e-9, 0.1
+    engine = AccidentalsEngine(['Channel A', 'Channel B', 'Channel C', 'Channel D'],
+                               ['Channel AB', 'Channel ABC', 'Channel ABCD'], window, gate_time)
+    counts = np.array([52000, 51000, 49000, 50000])
+    result = engine.compute(counts)[0]
+    for j, n in enumerate((2, 3, 4)):
+        expected = n * window ** (n - 1) * counts[:n].prod(dtype=np.float64) / gate_time ** (n - 1)
+        np.testing.assert_allclose(result[j], expected)
+    assert engine.channel_list == ['Noise AB', 'Noise ABC', 'Noise ABCD']
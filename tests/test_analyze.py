@@ -0,0 +1,28 @@
+from sp_visualization.analyze import analyze_run
+
+
+def summary(path):
+    return dict((row['channel'], row) for row in analyze_run(str(path)))
+
+
+def test_legacy_placeholder_row_is_skipped(tmp_path):
+    path = tmp_path / 'last_saved_run.csv'
+    path.write_text('"Channel A","Channel B","Channel AB","Noise","Count"\n1,1,1,1,1\n'
+                    '50000,51000,2000,5.1,2\n50100,51100,2010,5.2,3\n')
+    rows = summary(path)
+    assert rows['Channel A']['samples'] == 2
+    assert rows['Channel A']['min'] == 50000
+
+
+def test_first_row_of_a_new_run_is_kept(tmp_path):
+    path = tmp_path / 'run_20240131_142501.csv'
+    path.write_text('Channel A,Channel B,Channel AB,Noise AB,Count\n1,1,1,0.5,1\n50000,51000,2000,5.1,2\n')
+    assert summary(path)['Channel A']['samples'] == 2
+
+
+def test_renamed_legacy_run_without_a_noise_column(tmp_path):
+    path = tmp_path / 'archive_2019.csv'
+    path.write_text('"Channel A","Channel B","Channel AB","Count"\n1,1,1,1\n50000,51000,2000,2\n')
+    rows = summary(path)
+    assert rows['Channel A']['samples'] == 1
+    assert rows['Channel A']['min'] == 50000
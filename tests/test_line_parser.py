@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+
+from sp_visualization.line_parser import LineParser
+
+
+def one_by_one(lines, n_channels, dtype):
+    parser = LineParser(n_channels, dtype)
+    records = [parser.parse(line) for line in lines if line.strip()]
+    return [record for record in records if record is not None]
+
+
+@pytest.mark.parametrize('dtype', [np.int64, np.float64])
+@pytest.mark.parametrize('line', [b'-3, 4, 0', b'3, +4, 0', b'3, 4x, 0', b'3,, 0', b'3, 4.5, 0', b'3, 1e2, 0',
+                                  b'\x003, 4, 0', b'3, 4', b'3, 4, 0, 0', b'OK'])
+def test_corrupt_line_is_read_the_same_either_way(dtype, line):
+    lines = [b'1, 2, 0', line, b'5, 6, 0']
+    assert LineParser(2, dtype).parse_batch(lines).tolist() == one_by_one(lines, 2, dtype)
+
+
+@pytest.mark.parametrize('dtype', [np.int64, np.float64])
+def test_random_batches_are_read_the_same_either_way(dtype):
+    rng = np.random.default_rng(0)
+    alphabet = b'0123456789, -+.eEx\x00'
+    for _ in range(500):
+        lines = []
+        for _ in range(rng.integers(1, 5)):
+            line = bytearray(b', '.join(b'%d' % value for value in rng.integers(0, 1000, 3)))
+            for _ in range(rng.integers(0, 2)):
+                line[rng.integers(0, len(line))] = alphabet[rng.integers(0, len(alphabet))]
+            lines.append(bytes(line))
+        assert LineParser(2, dtype).parse_batch(lines).tolist() == one_by_one(lines, 2, dtype), lines
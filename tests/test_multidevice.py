@@ -0,0 +1,66 @@
+from sp_visualization.acquisition import Gap, SampleRingBuffer
+from sp_visualization.line_parser import LineParser
+from sp_visualization.multidevice import MergedBuffer
+
+
+def merged(first, second):
+    buffers = [SampleRingBuffer(mark_gaps=True), SampleRingBuffer(mark_gaps=True)]
+    buffers[0].put_many(first)
+    buffers[1].put_many(second)
+    for buffer in buffers:
+        buffer.close()
+    merge = MergedBuffer(buffers, [1, 1])
+    return merge.drain(0), merge
+
+
+def test_corrupt_line_keeps_devices_in_step():
+    parser = LineParser(1)
+    lines = [b'1, 0', b'2, 0', b'3x, 0', b'4, 0', b'OK']
+    first = [Gap() if record is None else record for record in parser.parse_positions(lines)]
+    samples, merge = merged(first, [[10], [20], [30], [40]])
+    assert samples == [[1, 10], [2, 20], [4, 40]]
+    assert merge.gapped == 1
+
+
+def test_overflow_keeps_devices_in_step():
+    buffer = SampleRingBuffer(capacity=2, mark_gaps=True)
+    assert buffer.put_many([[1], [2], [3], [4]]) == 2
+    first = buffer.drain(0)
+    buffer.put_many([[5]])
+    first += buffer.drain(0)
+    samples, merge = merged(first, [[10], [20], [30], [40], [50]])
+    assert samples == [[1, 10], [2, 20], [5, 50]]
+    assert merge.gapped == 2
+
+
+def test_stopped_device_is_padded_straight_away():
+    buffers = [SampleRingBuffer(mark_gaps=True), SampleRingBuffer(mark_gaps=True)]
+    buffers[1].put_many([[10]])
+    buffers[1].close()
+    buffers[0].put_many([[1], [2], [3]])
+    merge = MergedBuffer(buffers, [1, 1])
+    assert merge.drain(0) + merge.drain(0) == [[1, 10], [2, 0], [3, 0]]
+    assert merge.stopped == [1]
+    assert merge.padded == 2
+
+
+def test_slow_device_doesnt_hold_more_than_capacity():
+    buffers = [SampleRingBuffer(capacity=4, mark_gaps=True), SampleRingBuffer(capacity=4, mark_gaps=True)]
+    merge = MergedBuffer(buffers, [1, 1])
+    for value in range(0, 12, 4):
+        buffers[0].put_many([[value + k] for k in range(4)])
+        assert merge.drain(0) == []
+    assert len(merge._pending[0]) == 4
+    assert merge.overflow_count == 8
+    # The slow device catches up, the samples the first device dropped are dropped from it too
+    buffers[1].put_many([[100 + k] for k in range(4)])
+    assert merge.drain(0) == []
+    buffers[1].put_many([[104 + k] for k in range(4)])
+    merge.drain(0)
+    buffers[1].put_many([[108 + k] for k in range(4)])
+    assert merge.drain(0) == [[8, 108], [9, 109], [10, 110], [11, 111]]
+
+
+def test_line_with_garbage_in_front_keeps_its_place():
+    parser = LineParser(2)
+    assert parser.parse_positions([b'1, 2, 0', b'\x00\x003, 4, 0', b'5, 6, 0', b'OK']) == [[1, 2], None, [5, 6]]
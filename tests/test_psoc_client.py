@@ -0,0 +1,40 @@
+import time
+
+from sp_visualization.psoc_client import CommandClient, run
+
+
+class SlowSerial:
+    # Sends each reply line at its own time after the write
+    def __init__(self, lines, delays):
+        self.lines = lines
+        self.delays = delays
+        self.sent = 0
+        self.written = b''
+        self.start = None
+
+    def write(self, data):
+        self.written += data
+        self.start = time.perf_counter()
+
+    @property
+    def in_waiting(self):
+        if self.start is None or self.sent == len(self.lines):
+            return 0
+        return len(self.lines[self.sent]) if time.perf_counter() - self.start >= self.delays[self.sent] else 0
+
+    def read(self, size):
+        line = self.lines[self.sent]
+        self.sent += 1
+        return line
+
+
+def test_scan_reply_isnt_cut_short():
+    ser = SlowSerial([b'Scanning...\r\n', b'Done\r\n'], [0.01, 0.3])
+    assert run(CommandClient(ser).command('SCN')) == ['Scanning...', 'Done']
+
+
+def test_channel_configuration_waits_for_every_echo():
+    ser = SlowSerial([b'CTR0\r\n', b'CHN1000\r\n'], [0.01, 0.2])
+    client = CommandClient(ser)
+    client.echo = True
+    assert run(client.configure_channels(['CHN1000'])) == ['CTR0', 'CHN1000']
@@ -0,0 +1,73 @@
+import glob
+import os
+
+import numpy as np
+import pytest
+
+from sp_visualization.history import RunHistory, build_lod
+from sp_visualization.recorder import LOD_FACTORS, load_run, lod_path, open_recorder, recover_runs
+
+
+@pytest.mark.parametrize('save_format', ['csv', 'npy'])
+@pytest.mark.parametrize('n_samples', [1050, 1000, 999, 2345])
+def test_tiers_cover_the_whole_run(tmp_path, save_format, n_samples):
+    rows = np.random.default_rng(0).integers(0, 100, (n_samples, 2))
+    recorder = open_recorder(['Channel A', 'Channel AB'], str(tmp_path), save_format)
+    recorder.extend(rows)
+    path = recorder.close()
+    for factor in LOD_FACTORS:
+        tier = np.load(lod_path(path, factor))
+        assert tier['count'].sum() == n_samples
+        assert tier['Channel A']['max'].max() == rows[:, 0].max()
+
+
+def test_build_lod_of_a_multiple_of_the_chunk_size(tmp_path):
+    rows = np.random.default_rng(0).integers(0, 100, (2000, 1))
+    recorder = open_recorder(['Channel A'], str(tmp_path), 'npy', lod_factors=())
+    recorder.extend(rows)
+    path = recorder.close()
+    for tier_path in build_lod(path, chunk_size=1000):
+        assert np.load(tier_path)['count'].sum() == len(load_run(path))
+
+
+@pytest.mark.parametrize('save_format', ['csv', 'npy'])
+def test_accidentals_are_recorded_as_floats(tmp_path, save_format):
+    rows = np.array([[52000, 2000, 5.41], [51000, 1990, 0.0123]])
+    recorder = open_recorder(['Channel A', 'Channel AB', 'Noise AB'], str(tmp_path), save_format)
+    recorder.extend(rows)
+    path = recorder.close()
+    run = load_run(path)
+    assert run['Channel A'].tolist() == [52000, 51000]
+    np.testing.assert_allclose(run['Noise AB'], [5.41, 0.0123])
+    np.testing.assert_allclose(np.load(lod_path(path, 10))['Noise AB']['max'], [5.41])
+
+
+@pytest.mark.parametrize('save_format', ['csv', 'npy'])
+def test_recovered_run_gets_tiers_of_every_sample(tmp_path, save_format):
+    rows = np.random.default_rng(0).integers(0, 100, (2500, 1))
+    recorder = open_recorder(['Channel A'], str(tmp_path), save_format)
+    recorder.extend(rows)
+    recorder.flush()
+    # The session crashes here, leaving the run and its tiers as .partial files
+    assert recover_runs(str(tmp_path)) == [recorder.path]
+    assert not glob.glob(str(tmp_path / '*.partial'))
+    for factor in LOD_FACTORS:
+        assert np.load(lod_path(recorder.path, factor))['count'].sum() == 2500
+    assert RunHistory(recorder.path).n_samples == 2500
+
+
+def test_history_rebuilds_tiers_that_dont_cover_the_run(tmp_path):
+    rows = np.random.default_rng(0).integers(0, 100, (2500, 1))
+    recorder = open_recorder(['Channel A'], str(tmp_path), 'npy')
+    recorder.extend(rows)
+    path = recorder.close()
+    np.save(lod_path(path, 1000), np.load(lod_path(path, 1000))[:2])
+    history = RunHistory(path)
+    assert history.n_samples == 2500
+    assert history.tier(1000)['count'].sum() == 2500
+
+
+def test_runs_of_both_formats_in_the_same_second_get_their_own_tiers(tmp_path):
+    recorders = [open_recorder(['Channel A'], str(tmp_path), save_format) for save_format in ('csv', 'npy')]
+    paths = [recorder.close() for recorder in recorders]
+    assert os.path.splitext(paths[0])[0] != os.path.splitext(paths[1])[0]
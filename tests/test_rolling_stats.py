@@ -0,0 +1,23 @@
+import numpy as np
+
+from sp_visualization.rolling_stats import RollingStats
+
+
+def test_window_sum_across_the_wrap():
+    stats = RollingStats(['Channel A'], window=10)
+    stats.update(np.ones((8, 1)))
+    stats.update(np.zeros((5, 1)))
+    assert stats._window_sum[0] == 5
+
+
+def test_window_sum_matches_the_last_window():
+    rng = np.random.default_rng(0)
+    data = rng.integers(0, 1000, (5000, 2)).astype(np.float64)
+    stats = RollingStats(['Channel A', 'Channel B'], window=100)
+    pos = 0
+    while pos < len(data):
+        size = int(rng.integers(1, 60))
+        stats.update(data[pos:pos + size])
+        pos = min(pos + size, len(data))
+        np.testing.assert_allclose(stats._window_sum, data[max(0, pos - 100):pos].sum(axis=0))
+    np.testing.assert_allclose(stats.mean, data.mean(axis=0))